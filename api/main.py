@@ -1,15 +1,19 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
+import asyncio
 import logging
 from config.logging_config import configure_logging
-from config.settings import TIMEZONE
+from config.settings import TIMEZONE, METRICS_LOOP_LAG_INTERVAL
 from datetime import datetime
 from api.routes import scheduler as scheduler_router
-from api.routes import updates, status
+from api.routes import updates, status, versions
 from src.services.scheduler_instance import scheduler
 from main_scripts.knimeclicker import perform_clicks
 from api.routes.updates import trigger_updates
 from src.services.config_manager import ConfigManager
+from src.services import metrics
 
 # Configure logging
 configure_logging()
@@ -38,11 +42,22 @@ app.add_middleware(
 app.include_router(scheduler_router.router, prefix="/api/scheduler", tags=["scheduler"])
 app.include_router(updates.router, prefix="/api/updates", tags=["updates"])
 app.include_router(status.router, prefix="/api/status", tags=["status"])
+app.include_router(versions.router, prefix="/api/versions", tags=["versions"])
+
+def record_job_event(event):
+    """Count scheduler job runs; a job that raised or returned False counts as failed"""
+    metrics.scheduler_job_runs.inc(job=event.job_id)
+    if event.exception is not None or event.retval is False:
+        metrics.scheduler_job_failures.inc(job=event.job_id)
 
 @app.on_event("startup")
 async def startup_event():
     # Start the scheduler
+    scheduler.add_listener(record_job_event, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
     scheduler.start()
+    app.state.loop_lag_monitor = asyncio.create_task(
+        metrics.monitor_event_loop_lag(METRICS_LOOP_LAG_INTERVAL)
+    )
     
     # Get schedule from config file
     schedule = config_manager.get_schedule()
@@ -75,6 +90,7 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    app.state.loop_lag_monitor.cancel()
     scheduler.shutdown()
     logger.info("API Server shutting down, scheduler stopped")
 
@@ -84,4 +100,9 @@ async def root():
         "status": "running",
         "current_time": datetime.now(TIMEZONE).isoformat(),
         "scheduler_running": scheduler.running
-    } 
\ No newline at end of file
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text format metrics"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
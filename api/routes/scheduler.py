@@ -8,12 +8,10 @@ from src.services.scheduler_instance import scheduler
 from config.settings import TIMEZONE
 from main_scripts.knimeclicker import perform_clicks
 from api.routes.updates import trigger_updates
-from src.services.status_tracker import StatusTracker
 from src.services.config_manager import ConfigManager
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
-status_tracker = StatusTracker()
 config_manager = ConfigManager()
 
 class ScheduleUpdate(BaseModel):
@@ -5,10 +5,9 @@ from datetime import datetime
 from typing import Dict, Any
 
 from config.settings import DATA_DIR, TIMEZONE
-from src.services.status_tracker import StatusTracker
+from src.services.status_tracker_instance import status_tracker
 
 router = APIRouter()
-status_tracker = StatusTracker()
 
 @router.get("/system")
 async def get_system_status():
@@ -37,10 +36,11 @@ async def get_dataset_status():
     return dataset_info
 
 @router.get("/history")
-async def get_update_history(limit: int = 50, update_type: str = None):
-    """Get update history with optional filtering"""
-    if update_type:
-        latest_status = status_tracker.get_latest_status(update_type)
-        return [latest_status] if latest_status else []
-    else:
-        return status_tracker.get_recent_updates(limit)
\ No newline at end of file
+async def get_update_history(limit: int = 50, update_type: str = None, offset: int = 0,
+                             status: str = None, since: str = None, until: str = None):
+    """Get update history, newest first, with optional filtering and paging"""
+    limit = max(1, min(limit, 1000))
+    offset = max(0, offset)
+    if not (update_type or status or since or until or offset):
+        return status_tracker.get_recent_updates(limit)
+    return status_tracker.query_history(limit, offset, update_type, status, since, until)
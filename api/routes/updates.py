@@ -4,17 +4,26 @@ import logging
 from datetime import datetime
 import aiohttp
 import os
+import json
+import time
 import asyncio
 
-from src.services.status_tracker import StatusTracker
+from src.services.status_tracker_instance import status_tracker
+from src.services.event_bus import event_bus
 from src.socrata_updater import SocrataUpdater
 from src.sms_handler import SMSHandler
 from src.ftp_handler import FTPHandler
-from config.settings import DATA_DIR
+from src.services.update_pipeline import run_update_job, summarize_run
+from config.settings import (
+    DATA_DIR,
+    SSE_COALESCE_WINDOW,
+    SSE_HEARTBEAT_INTERVAL,
+    UPDATE_CHECK_CACHE_TTL,
+    UPDATE_CHECK_TIMEOUT
+)
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
-status_tracker = StatusTracker()
 
 @router.get("/status")
 async def get_update_status():
@@ -44,109 +53,150 @@ async def get_update_status():
 async def trigger_updates():
     """Manually trigger the update process"""
     try:
-        async with aiohttp.ClientSession() as session:
-            # Initialize updaters with status tracker
-            socrata_updater = SocrataUpdater(session, status_tracker)
-            sms_handler = SMSHandler(session)
-            ftp_handler = FTPHandler()
-
-            results = {
-                "socrata": False,
-                "sms": False,
-                "ftp": False
-            }
-
-            # Socrata updates
-            try:
-                status_tracker.log_update("socrata", "updating", {"message": "Starting Socrata updates"})
-                results["socrata"] = await socrata_updater.update_and_download_datasets()
-                status = "success" if results["socrata"] else "no_update"
-                status_tracker.log_update("socrata", status, {"updated": results["socrata"]})
-            except Exception as e:
-                logger.error(f"Socrata update failed: {str(e)}")
-                status_tracker.log_update("socrata", "failed", {"error": str(e)})
-
-            # Similar blocks for SMS and FTP...
-            
-            return {
-                "message": "Update process completed",
-                "results": results
-            }
+        for update_type in ["socrata", "sms", "ftp"]:
+            status_tracker.log_update(update_type, "updating", {"message": f"Starting {update_type} updates"})
+
+        node_stats = await run_update_job(status_tracker)
+        results = summarize_run(node_stats)
+
+        # Log one final status per source, as the dashboard expects
+        for update_type, updated in results.items():
+            errors = [
+                f"{name}: {record['error']}" for name, record in node_stats.items()
+                if record.get("source") == update_type and record["status"] == "failed"
+            ]
+            if errors:
+                status_tracker.log_update(update_type, "failed", {"error": "; ".join(errors)})
+            else:
+                status = "success" if updated else "no_update"
+                status_tracker.log_update(update_type, status, {"updated": updated})
+        failed = [name for name, record in node_stats.items() if record["status"] == "failed"]
+        if not failed:
+            pipeline_status = "success"
+        else:
+            pipeline_status = "failed" if len(failed) == len(node_stats) else "partial"
+        status_tracker.log_update("pipeline", pipeline_status, {"stages": node_stats, "failed": failed})
+
+        return {
+            "message": "Update process completed",
+            "results": results,
+            "stages": node_stats
+        }
     except Exception as e:
         logger.error(f"Update process failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/check")
-async def check_updates():
-    """Check all data sources for available updates without downloading"""
+# Last /check result, shared by all callers until UPDATE_CHECK_CACHE_TTL expires
+_check_cache = {"result": None, "checked_at": None, "monotonic": 0.0}
+_check_lock = asyncio.Lock()
+
+async def timed_probe(coro, previous=None):
+    """Run one source probe with UPDATE_CHECK_TIMEOUT and attach its latency.
+
+    A probe that fails or times out yields an error entry, or the previous
+    good entry marked stale when one is cached.
+    """
+    start = time.perf_counter()
     try:
-        updates_available = {
-            "socrata": {},
-            "sms": None,
-            "ftp": {}
-        }
+        entry = await asyncio.wait_for(coro, UPDATE_CHECK_TIMEOUT)
+    except Exception as e:
+        error = f"Timed out after {UPDATE_CHECK_TIMEOUT:g}s" if isinstance(e, asyncio.TimeoutError) else str(e)
+        logger.error(f"Update check probe failed: {error}")
+        if previous and ("error" not in previous or previous.get("stale")):
+            entry = dict(previous, stale=True, error=error)
+        else:
+            entry = {"error": error}
+    entry["latency"] = round(time.perf_counter() - start, 3)
+    return entry
+
+async def run_update_check(previous=None):
+    """Probe every Socrata view, the SMS server and the FTP listings concurrently"""
+    previous = previous or {}
+
+    async with aiohttp.ClientSession() as session:
+        socrata_updater = SocrataUpdater(session)
+        sms_handler = SMSHandler(session)
+        # One pooled connection (and one cached listing) serves all three FTP probes.
+        # The socket timeout bounds the worker thread a timed-out probe leaves behind,
+        # which close() waits for before logging out.
+        ftp_handler = FTPHandler(timeout=UPDATE_CHECK_TIMEOUT)
+        file_types = ['Crash', 'Inspection', 'Violation']
+
+        async def check_socrata(dataset_name):
+            view = await socrata_updater.fetch_view_metadata(socrata_updater.datasets[dataset_name], dataset_name)
+
+            # Get local date
+            metadata_file = os.path.join(DATA_DIR, dataset_name, f"{dataset_name}_metadata.json")
+            local_date = None
+            if os.path.exists(metadata_file):
+                metadata = await socrata_updater.read_metadata(metadata_file)
+                if metadata and 'rowsUpdatedAt' in metadata:
+                    local_date = datetime.fromisoformat(metadata['rowsUpdatedAt'])
+
+            # Get server date
+            server_date = socrata_updater.parse_rows_updated_at(view, socrata_updater.datasets[dataset_name])
+            return {
+                "local_date": local_date.isoformat() if local_date else None,
+                "server_date": server_date.isoformat() if server_date else None,
+                "update_needed": server_date > local_date if local_date else True
+            }
 
-        async with aiohttp.ClientSession() as session:
-            # Check Socrata datasets
-            socrata_updater = SocrataUpdater(session)
-            for dataset_name, dataset_url in socrata_updater.datasets.items():
-                try:
-                    # Get local date
-                    metadata_file = os.path.join(DATA_DIR, dataset_name, f"{dataset_name}_metadata.json")
-                    local_date = None
-                    if os.path.exists(metadata_file):
-                        metadata = await socrata_updater.read_metadata(metadata_file)
-                        if metadata and 'rowsUpdatedAt' in metadata:
-                            local_date = datetime.fromisoformat(metadata['rowsUpdatedAt'])
-
-                    # Get server date
-                    server_date = await socrata_updater.check_dataset_update(dataset_url)
-
-                    updates_available["socrata"][dataset_name] = {
-                        "local_date": local_date.isoformat() if local_date else None,
-                        "server_date": server_date.isoformat() if server_date else None,
-                        "update_needed": server_date > local_date if local_date else True
-                    }
-                except Exception as e:
-                    logger.error(f"Error checking {dataset_name}: {str(e)}")
-                    updates_available["socrata"][dataset_name] = {
-                        "error": str(e)
-                    }
+        async def check_sms():
+            latest_file = await sms_handler.find_latest_available_file()
+            local_files = sms_handler.list_local_files()
+            return {
+                "local_file": max(local_files) if local_files else None,
+                "server_file": latest_file,
+                "update_needed": latest_file != max(local_files) if local_files else True
+            }
 
-            # Check SMS files
-            sms_handler = SMSHandler(session)
-            try:
-                latest_file = await sms_handler.find_latest_available_file()
-                local_files = [f for f in os.listdir(os.path.join(DATA_DIR, 'SMS')) 
-                             if f.endswith('.zip')] if os.path.exists(os.path.join(DATA_DIR, 'SMS')) else []
-                
-                updates_available["sms"] = {
-                    "local_file": max(local_files) if local_files else None,
-                    "server_file": latest_file,
-                    "update_needed": not local_files or latest_file != max(local_files) if local_files else True
-                }
-            except Exception as e:
-                logger.error(f"Error checking SMS files: {str(e)}")
-                updates_available["sms"] = {"error": str(e)}
-
-            # Check FTP files
-            ftp_handler = FTPHandler()
-            for file_type in ['Crash', 'Inspection', 'Violation']:
-                try:
-                    latest_remote = await ftp_handler.find_latest_file(file_type)
-                    local_dir = os.path.join(DATA_DIR, f'FTP_{file_type}')
-                    latest_local = ftp_handler.find_latest_local_file(local_dir, file_type)
-
-                    updates_available["ftp"][file_type] = {
-                        "local_file": latest_local,
-                        "server_file": latest_remote,
-                        "update_needed": latest_remote != latest_local if latest_local else True
-                    }
-                except Exception as e:
-                    logger.error(f"Error checking FTP {file_type}: {str(e)}")
-                    updates_available["ftp"][file_type] = {"error": str(e)}
+        async def check_ftp(file_type):
+            latest_remote = await ftp_handler.find_latest_file(file_type)
+            local_dir = os.path.join(DATA_DIR, f'FTP_{file_type}')
+            latest_local = ftp_handler.find_latest_local_file(local_dir, file_type)
+            return {
+                "local_file": latest_local,
+                "server_file": latest_remote,
+                "update_needed": latest_remote != latest_local if latest_local else True
+            }
+
+        dataset_names = list(socrata_updater.datasets)
+        try:
+            results = await asyncio.gather(
+                *(timed_probe(check_socrata(name), previous.get("socrata", {}).get(name)) for name in dataset_names),
+                timed_probe(check_sms(), previous.get("sms")),
+                *(timed_probe(check_ftp(t), previous.get("ftp", {}).get(t)) for t in file_types)
+            )
+        finally:
+            await asyncio.to_thread(ftp_handler.close)
+
+    return {
+        "socrata": dict(zip(dataset_names, results[:len(dataset_names)])),
+        "sms": results[len(dataset_names)],
+        "ftp": dict(zip(file_types, results[len(dataset_names) + 1:]))
+    }
+
+@router.get("/check")
+async def check_updates(refresh: bool = False):
+    """Check all data sources for available updates without downloading.
 
-        return updates_available
+    Results are cached for UPDATE_CHECK_CACHE_TTL seconds (refresh=true
+    bypasses the cache); concurrent callers share one in-flight check.
+    """
+    try:
+        async with _check_lock:
+            age = time.monotonic() - _check_cache["monotonic"]
+            if refresh or _check_cache["result"] is None or age >= UPDATE_CHECK_CACHE_TTL:
+                _check_cache["result"] = await run_update_check(_check_cache["result"])
+                _check_cache["checked_at"] = datetime.utcnow().isoformat()
+                _check_cache["monotonic"] = time.monotonic()
+                age = 0.0
+
+        return dict(
+            _check_cache["result"],
+            checked_at=_check_cache["checked_at"],
+            cache_age=round(age, 1)
+        )
 
     except Exception as e:
         logger.error(f"Update check failed: {str(e)}")
@@ -154,36 +204,43 @@ async def check_updates():
 
 @router.get("/stream")
 async def stream_updates(request: Request):
-    """Stream real-time updates using Server-Sent Events"""
-    async def event_generator():
-        while True:
-            if await request.is_disconnected():
-                break
+    """Stream real-time updates using Server-Sent Events.
 
-            # Get current progress from status tracker
-            current_progress = status_tracker.current_progress
-            
+    Sends a snapshot on connect, then only what changed: logged updates as
+    they happen and download progress coalesced per SSE_COALESCE_WINDOW.
+    Idle connections cost nothing but the periodic heartbeat ping.
+    """
+    async def event_generator():
+        subscription = event_bus.subscribe()
+        try:
+            current_progress = status_tracker.get_progress()
             if current_progress:
-                # We have active downloads
-                yield {
-                    "event": "update",
-                    "data": {
-                        "type": "download",
-                        "datasets": current_progress
-                    }
-                }
-            else:
-                # Get latest status
-                updates = status_tracker.get_recent_updates(1)
-                if updates:
+                yield {"event": "update", "data": json.dumps({"type": "download", "datasets": current_progress})}
+            updates = status_tracker.get_recent_updates(1)
+            if updates:
+                yield {"event": "update", "data": json.dumps({"type": "status", "updates": updates})}
+
+            while not subscription.closed:
+                await subscription.wake.wait()
+                subscription.wake.clear()
+                if await request.is_disconnected():
+                    break
+
+                while not subscription.queue.empty():
+                    event = subscription.queue.get_nowait()
+                    yield {"event": "update", "data": json.dumps({"type": "status", "updates": [event]})}
+
+                if subscription.progress:
+                    # Let a burst of ticks from parallel downloads merge into one delta
+                    await asyncio.sleep(SSE_COALESCE_WINDOW)
+                    progress = subscription.take_progress()
+                    datasets = {name: p for name, p in progress.items() if p is not None}
+                    finished = [name for name, p in progress.items() if p is None]
                     yield {
                         "event": "update",
-                        "data": {
-                            "type": "status",
-                            "updates": updates
-                        }
+                        "data": json.dumps({"type": "download", "datasets": datasets, "finished": finished})
                     }
+        finally:
+            event_bus.unsubscribe(subscription)
 
-            await asyncio.sleep(1)  # Check every second
-
-    return EventSourceResponse(event_generator())
\ No newline at end of file
+    return EventSourceResponse(event_generator(), ping=SSE_HEARTBEAT_INTERVAL)
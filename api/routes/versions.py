@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException
+import os
+import asyncio
+
+from config.settings import VERSION_STORE_DIR
+from src.version_store import VersionStore
+
+router = APIRouter()
+
+# Materialized versions are written here as <dataset>/<version>/
+RESTORE_DIR = os.path.join(VERSION_STORE_DIR, 'restored')
+
+def get_known_version(store: VersionStore, dataset: str, version: str = None):
+    if dataset not in store.list_datasets():
+        raise HTTPException(status_code=404, detail=f"No versions recorded for {dataset}")
+    if version is not None and version not in store.version_ids(dataset):
+        raise HTTPException(status_code=404, detail=f"{dataset} has no version {version}")
+
+@router.get("/")
+async def get_version_store():
+    """Datasets with recorded versions and the store's disk usage"""
+    store = VersionStore()
+    usage = await asyncio.to_thread(store.usage)
+    return {
+        "datasets": {name: len(store.version_ids(name)) for name in store.list_datasets()},
+        **usage
+    }
+
+@router.get("/{dataset}")
+async def get_dataset_versions(dataset: str):
+    """Recorded versions of a dataset, newest first"""
+    store = VersionStore()
+    get_known_version(store, dataset)
+    return await asyncio.to_thread(store.list_versions, dataset)
+
+@router.post("/{dataset}/{version}/materialize")
+async def materialize_version(dataset: str, version: str, as_stored: bool = False):
+    """Rebuild a past version of a dataset on disk and return where it was written"""
+    store = VersionStore()
+    get_known_version(store, dataset, version)
+    target_dir = os.path.join(RESTORE_DIR, dataset, version)
+    try:
+        await asyncio.to_thread(store.materialize, dataset, version, target_dir, as_stored)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"dataset": dataset, "version": version, "path": target_dir}
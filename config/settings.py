@@ -20,6 +20,15 @@ CLICKER_SCHEDULE_TIME = os.environ.get('CLICKER_SCHEDULE_TIME', "23:45")  # 11:4
 # Maximum number of retries for KNIME workflow
 MAX_KNIME_RETRIES = int(os.environ.get('MAX_KNIME_RETRIES', 5))
 
+# Update history store (SQLite) and its retention (0 days = no age limit); the JSON file is migrated once
+STATUS_DB_FILE = os.environ.get('STATUS_DB_FILE', os.path.join(BASE_DIR, 'update_history.db'))
+LEGACY_HISTORY_FILE = os.path.join(BASE_DIR, 'update_history.json')
+HISTORY_RETENTION_DAYS = int(os.environ.get('HISTORY_RETENTION_DAYS', 0))
+HISTORY_MAX_ENTRIES = int(os.environ.get('HISTORY_MAX_ENTRIES', 100000))
+HISTORY_COMPACT_EVERY = int(os.environ.get('HISTORY_COMPACT_EVERY', 1000))
+# Recent events kept in memory so dashboard polling never touches the store
+HISTORY_RECENT_BUFFER = int(os.environ.get('HISTORY_RECENT_BUFFER', 500))
+
 # Logging configuration
 LOG_FILE = os.path.join(BASE_DIR, 'logs', 'application.log')
 LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
@@ -36,6 +45,128 @@ DATASET_URLS = {
     'CrashFile': 'https://datahub.transportation.gov/api/views/aayw-vxb3'
 }
 
+# Per-dataset options for the Socrata datasets above.
+#   incremental: fetch only rows changed since the last sync through the SODA
+#                API and merge them into the local CSV on the row identifier.
+#                Merged rows carry SODA value formatting (ISO timestamps, raw
+#                numbers) while the rest of the file keeps rows.csv formatting,
+#                and rows deleted upstream stay until the next full export
+#                (at least every SODA_FULL_REFRESH_DAYS)
+#   paged:       do full refreshes as parallel $limit/$offset SODA pages
+#                stitched into one CSV instead of a single rows.csv stream.
+#                Values keep SODA formatting, not rows.csv display formatting
+#   storage:     at-rest format overriding DATASET_STORAGE
+#   compressed_transfer: ask for a gzip-encoded rows.csv transfer; fewer bytes
+#                on the wire, but an interrupted gzip transfer cannot be
+#                resumed and restarts from zero
+# No dataset uses these by default, e.g. {'CarrierAllWithHistory': {'paged': True}}
+DATASET_OPTIONS = {}
+
+# At-rest format of downloaded Socrata CSVs: 'plain', 'gzip' or 'zstd' (requires
+# zstandard); DATASET_OPTIONS[<dataset>]['storage'] opts single datasets in.
+# KNIME reads the plain <dataset>.csv, so only compress datasets it does not use.
+# A compressed dataset is downloaded plain (to stay resumable) and compressed
+# in a second pass, which costs one extra write of the file and, briefly, both
+# copies on disk
+DATASET_STORAGE = os.environ.get('DATASET_STORAGE', 'plain')
+STORAGE_COMPRESSION_LEVEL = {
+    'gzip': int(os.environ.get('STORAGE_GZIP_LEVEL', 6)),
+    'zstd': int(os.environ.get('STORAGE_ZSTD_LEVEL', 3))
+}
+
+# Optional Parquet copy of each raw file (requires pyarrow); overrides map
+# a dataset (Socrata name, FTP_<type> or SMS) to {column: type name}
+COLUMNAR_ENABLED = os.environ.get('COLUMNAR_ENABLED', 'false').lower() == 'true'
+COLUMNAR_COMPRESSION = os.environ.get('COLUMNAR_COMPRESSION', 'zstd')
+COLUMNAR_BLOCK_SIZE = int(os.environ.get('COLUMNAR_BLOCK_SIZE', 64 * 1024 * 1024))
+# e.g. {'SMS': {'DOT_NUMBER': 'string'}}
+COLUMNAR_SCHEMA_OVERRIDES = {}
+
+# SODA incremental sync paging and the change-set size above which a full export is cheaper
+SODA_PAGE_SIZE = int(os.environ.get('SODA_PAGE_SIZE', 50000))
+SODA_INCREMENTAL_MAX_ROWS = int(os.environ.get('SODA_INCREMENTAL_MAX_ROWS', 500000))
+# Days after which an incremental dataset is fully exported again, dropping rows deleted upstream
+SODA_FULL_REFRESH_DAYS = int(os.environ.get('SODA_FULL_REFRESH_DAYS', 7))
+
+# Seconds a fetched Socrata view (/api/views/<id>) is reused in-process before revalidating
+SOCRATA_VIEW_CACHE_TTL = int(os.environ.get('SOCRATA_VIEW_CACHE_TTL', 60))
+
+# Paged full export: rows per page and pages fetched in parallel per dataset
+SODA_EXPORT_PAGE_SIZE = int(os.environ.get('SODA_EXPORT_PAGE_SIZE', 250000))
+SODA_EXPORT_WORKERS = int(os.environ.get('SODA_EXPORT_WORKERS', 4))
+
 # FTP and SMS URLs
-FTP_URL = 'ftp://ftp.senture.com/'
-SMS_BASE_URL = 'https://ai.fmcsa.dot.gov/SMS/files/'
\ No newline at end of file
+FTP_URL = os.environ.get('FTP_URL', 'ftp://ftp.senture.com/')
+SMS_BASE_URL = 'https://ai.fmcsa.dot.gov/SMS/files/'
+
+# Update pipeline: stages of the update graph allowed to run at the same time
+PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', 8))
+
+# ZIP extraction: skip archives whose output is still current, and worker processes (0 = one per CPU)
+ZIP_INCREMENTAL = os.environ.get('ZIP_INCREMENTAL', 'true').lower() == 'true'
+ZIP_PROCESS_WORKERS = int(os.environ.get('ZIP_PROCESS_WORKERS', 0))
+
+# FTP control connections kept per run, socket timeout and idle time before a pooled connection is dropped
+FTP_POOL_SIZE = int(os.environ.get('FTP_POOL_SIZE', 3))
+FTP_TIMEOUT = int(os.environ.get('FTP_TIMEOUT', 60))
+FTP_IDLE_TIMEOUT = int(os.environ.get('FTP_IDLE_TIMEOUT', 240))
+
+# Seconds a remote FTP directory listing is reused
+FTP_LISTING_TTL = int(os.environ.get('FTP_LISTING_TTL', 300))
+
+# Extract the SMS text file straight from the remote zip with Range requests
+SMS_REMOTE_EXTRACT = os.environ.get('SMS_REMOTE_EXTRACT', 'true').lower() == 'true'
+
+# Seconds an SMS month confirmed missing on the server is not probed again
+SMS_NEGATIVE_CACHE_TTL = int(os.environ.get('SMS_NEGATIVE_CACHE_TTL', 3600))
+
+# Socrata refresh concurrency: overall cap and cap per remote host
+SOCRATA_CONCURRENT_REFRESH = os.environ.get('SOCRATA_CONCURRENT_REFRESH', 'true').lower() == 'true'
+SOCRATA_MAX_CONCURRENT_DOWNLOADS = int(os.environ.get('SOCRATA_MAX_CONCURRENT_DOWNLOADS', 4))
+SOCRATA_MAX_DOWNLOADS_PER_HOST = int(os.environ.get('SOCRATA_MAX_DOWNLOADS_PER_HOST', 2))
+
+# HTTP download retries; partial downloads resume from their .part file
+DOWNLOAD_MAX_RETRIES = int(os.environ.get('DOWNLOAD_MAX_RETRIES', 3))
+DOWNLOAD_RETRY_DELAY = int(os.environ.get('DOWNLOAD_RETRY_DELAY', 10))
+
+# Server-sent event fan-out: per-client queue size, heartbeat and progress coalescing
+SSE_QUEUE_SIZE = int(os.environ.get('SSE_QUEUE_SIZE', 100))
+SSE_HEARTBEAT_INTERVAL = int(os.environ.get('SSE_HEARTBEAT_INTERVAL', 15))
+SSE_COALESCE_WINDOW = float(os.environ.get('SSE_COALESCE_WINDOW', 0.25))
+
+# Seconds between event loop lag samples for /metrics
+METRICS_LOOP_LAG_INTERVAL = float(os.environ.get('METRICS_LOOP_LAG_INTERVAL', 1.0))
+
+# /api/updates/check: seconds a result is reused and per-source probe timeout
+UPDATE_CHECK_CACHE_TTL = int(os.environ.get('UPDATE_CHECK_CACHE_TTL', 300))
+UPDATE_CHECK_TIMEOUT = float(os.environ.get('UPDATE_CHECK_TIMEOUT', 15))
+
+# Entries kept in the audit history of each dataset's run_manifest.json
+RUN_MANIFEST_HISTORY = int(os.environ.get('RUN_MANIFEST_HISTORY', 50))
+
+# Skip the KNIME click sequence when no dataset changed since KNIME last completed.
+# Completion is only recorded once KNIME_OUTPUT_FILE, a file the workflow writes
+# when it finishes, is modified within KNIME_COMPLETION_TIMEOUT seconds of the clicks
+KNIME_SKIP_UNCHANGED = os.environ.get('KNIME_SKIP_UNCHANGED', 'false').lower() == 'true'
+KNIME_OUTPUT_FILE = os.environ.get('KNIME_OUTPUT_FILE', '')
+KNIME_COMPLETION_TIMEOUT = int(os.environ.get('KNIME_COMPLETION_TIMEOUT', 4 * 3600))
+KNIME_COMPLETION_POLL_INTERVAL = int(os.environ.get('KNIME_COMPLETION_POLL_INTERVAL', 60))
+
+# Publish each dataset as an immutable generation behind data/<dataset>/current
+# (a symlink, or a directory junction on Windows), keeping this many previous
+# generations. Enable once the KNIME workflow reads its inputs from current/
+GENERATIONS_ENABLED = os.environ.get('GENERATIONS_ENABLED', 'false').lower() == 'true'
+GENERATION_RETENTION = int(os.environ.get('GENERATION_RETENTION', 2))
+
+# Chunk-deduplicated, compressed history of published dataset versions: average
+# chunk size, newest versions kept, and months kept at one version each. Opt-in,
+# as the first snapshot chunks and compresses the whole data tree
+VERSION_STORE_ENABLED = os.environ.get('VERSION_STORE_ENABLED', 'false').lower() == 'true'
+VERSION_STORE_DIR = os.environ.get('VERSION_STORE_DIR', os.path.join(BASE_DIR, 'versions'))
+VERSION_CHUNK_SIZE = int(os.environ.get('VERSION_CHUNK_SIZE', 1024 * 1024))
+VERSION_KEEP_LAST = int(os.environ.get('VERSION_KEEP_LAST', 7))
+VERSION_KEEP_MONTHLY = int(os.environ.get('VERSION_KEEP_MONTHLY', 12))
+# Archives and derived Parquet copies dedup poorly and are rebuilt from the extracted/raw text
+VERSION_EXCLUDE_SUFFIXES = tuple(
+    s for s in os.environ.get('VERSION_EXCLUDE_SUFFIXES', '.zip,.parquet').split(',') if s
+)
@@ -1,7 +1,19 @@
 import pyautogui
+import os
+import time
 import asyncio
 import logging
 from datetime import datetime
+from src.services.metrics import knime_click_duration
+from src.services.update_pipeline import FTP_FILE_TYPES
+from src.run_manifest import stale_datasets, read_manifest, update_manifest
+from config.settings import (
+    DATASET_URLS,
+    KNIME_SKIP_UNCHANGED,
+    KNIME_OUTPUT_FILE,
+    KNIME_COMPLETION_TIMEOUT,
+    KNIME_COMPLETION_POLL_INTERVAL
+)
 
 logger = logging.getLogger(__name__)
 
@@ -9,10 +21,42 @@ logger = logging.getLogger(__name__)
 FIRST_CLICK_COORDINATES = (207, 90)  # Replace with your coordinates
 SECOND_CLICK_COORDINATES = (408, 89)  # Replace with your coordinates
 
-async def perform_clicks():
-    """Performs the automated clicking sequence."""
+# Every dataset KNIME reads
+KNIME_DATASETS = list(DATASET_URLS) + ['SMS'] + [f"FTP_{t}" for t in FTP_FILE_TYPES]
+
+async def wait_for_knime_output(clicked_at):
+    """True once KNIME_OUTPUT_FILE is modified after clicked_at, False on timeout"""
+    deadline = time.time() + KNIME_COMPLETION_TIMEOUT
+    while time.time() < deadline:
+        try:
+            if os.path.getmtime(KNIME_OUTPUT_FILE) > clicked_at:
+                return True
+        except OSError:
+            pass
+        await asyncio.sleep(KNIME_COMPLETION_POLL_INTERVAL)
+    return False
+
+async def perform_clicks(force=False):
+    """Performs the automated clicking sequence.
+
+    With KNIME_SKIP_UNCHANGED, skipped when every dataset's run manifest
+    shows a confirmed KNIME run on its current input (unless force). A
+    run is only confirmed, and recorded, when the workflow updates
+    KNIME_OUTPUT_FILE after the clicks.
+    """
     current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     logger.info(f"Starting perform_clicks function at {current_time}")
+    pending = await asyncio.to_thread(stale_datasets, 'knime', KNIME_DATASETS)
+    if KNIME_SKIP_UNCHANGED and not force and not pending:
+        logger.info("No dataset changed since the last KNIME run, skipping clicks")
+        return True
+    logger.info(f"Datasets changed since the last KNIME run: {', '.join(pending) or 'none'}")
+    # Inputs as they are now; a download finishing during the run must stay pending
+    inputs = {
+        name: (await asyncio.to_thread(read_manifest, name)).input_sha256 for name in pending
+    }
+    start = time.perf_counter()
+    clicked_at = time.time()
     try:
         # Log mouse position before clicking
         current_pos = pyautogui.position()
@@ -34,8 +78,25 @@ async def perform_clicks():
             logger.info(f"Completed click {i+1}/10 at position {FIRST_CLICK_COORDINATES}")
             await asyncio.sleep(1)
 
+        knime_click_duration.observe(time.perf_counter() - start, status="success")
         logger.info("perform_clicks function completed successfully")
-        return True
     except Exception as e:
         logger.error(f"Error in perform_clicks: {str(e)}", exc_info=True)
+        knime_click_duration.observe(time.perf_counter() - start, status="failed")
+        return False
+    return await confirm_knime_run(inputs, clicked_at)
+
+async def confirm_knime_run(inputs, clicked_at):
+    """Record the 'knime' stage for inputs once the workflow's output shows it finished"""
+    if not KNIME_OUTPUT_FILE:
+        logger.info("KNIME_OUTPUT_FILE is not set, KNIME completion is not recorded")
+        return True
+    logger.info(f"Waiting for KNIME to update {KNIME_OUTPUT_FILE}")
+    if not await wait_for_knime_output(clicked_at):
+        logger.error(f"KNIME did not update {KNIME_OUTPUT_FILE} within {KNIME_COMPLETION_TIMEOUT}s")
         return False
+    for dataset_name, input_sha256 in inputs.items():
+        if input_sha256:
+            await asyncio.to_thread(update_manifest, dataset_name, 'record_output', 'knime', None, input_sha256)
+    logger.info(f"KNIME run confirmed by {KNIME_OUTPUT_FILE}")
+    return True
@@ -7,20 +7,14 @@ import platform
 import signal
 import logging
 import time
-import aiohttp
-import pyautogui
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.socrata_updater import SocrataUpdater
-from src.ftp_handler import FTPHandler
-from src.sms_handler import SMSHandler
-from main_scripts.knimeclicker import perform_clicks
+from src.services.update_pipeline import run_update_job, summarize_run
 from config.settings import (
     TIMEZONE,
     DATASET_UPDATE_TIME,
     CLICKER_SCHEDULE_TIME,
-    MAX_KNIME_RETRIES,
-    DATA_DIR
+    MAX_KNIME_RETRIES
 )
 from src.error_handler import KNIMEError
 from config.logging_config import configure_logging
@@ -28,7 +22,6 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
 from apscheduler.events import EVENT_JOB_ERROR
-from src.zip_processor import ZipProcessor
 
 # Set the flag file path relative to the script's directory
 FLAG_FILE = os.path.join(os.path.dirname(__file__), '..', 'script_running.flag')
@@ -38,8 +31,8 @@ keep_updating_flag = True
 scheduler = None
 knime_retry_count = 0
 
-# Configure logging
-configure_logging()
+# Logging is configured under the __main__ guard: ZIP worker processes
+# spawned on Windows re-import this module as __mp_main__
 logger = logging.getLogger(__name__)
 
 # Define the coordinates for the clicks
@@ -58,35 +51,18 @@ async def update_flag_file():
 
 async def update_datasets():
     logger.info("Starting dataset update")
-    updated = False
 
     try:
-        # Create session with custom timeout
-        timeout = aiohttp.ClientTimeout(total=None, connect=60, sock_read=3600)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            # Process Socrata datasets
-            socrata_updater = SocrataUpdater(session)
-            if await socrata_updater.update_and_download_datasets():
-                updated = True
-
-            # Process SMS file
-            sms_handler = SMSHandler(session)
-            if await sms_handler.download_latest_sms_file():
-                updated = True
-
-        # Process FTP files (separate from HTTP session)
-        ftp_handler = FTPHandler()
-        if await ftp_handler.download_ftp_files():
-            updated = True
-
-        if updated:
+        # Same stage graph as the API trigger: downloads, then per-source extraction
+        node_stats = await run_update_job()
+        results = summarize_run(node_stats)
+
+        if any(results.values()):
             logger.info("Datasets have been updated")
         else:
             logger.info("No updates found for datasets")
 
-        # Process ZIP files after all updates are complete
-        zip_processor = ZipProcessor(DATA_DIR)
-        if await zip_processor.process_all_zips():
+        if any(record["status"] == "updated" for name, record in node_stats.items() if name.startswith("extract_")):
             logger.info("ZIP files processed successfully")
         else:
             logger.info("No ZIP files needed processing")
@@ -119,6 +95,8 @@ def handle_shutdown():
 
 async def main():
     global scheduler, keep_updating_flag
+    # Imported here so spawned worker processes never load pyautogui
+    from main_scripts.knimeclicker import perform_clicks
     logger.info("Starting the update process")
 
     try:
@@ -213,4 +191,5 @@ async def main():
                 logger.error(f"Error removing flag file: {str(e)}")
 
 if __name__ == "__main__":
+    configure_logging()
     asyncio.run(main())
@@ -0,0 +1,248 @@
+# src/columnar_converter.py
+import os
+import csv
+import json
+import asyncio
+import logging
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency, only needed when COLUMNAR_ENABLED
+    pa = None
+
+from config.settings import (
+    DATA_DIR,
+    COLUMNAR_COMPRESSION,
+    COLUMNAR_BLOCK_SIZE,
+    COLUMNAR_SCHEMA_OVERRIDES
+)
+from src.storage import find_stored_file, logical_path, open_stored
+from src.run_manifest import read_manifest, update_manifest, sha256_file
+
+COLUMNAR_SUFFIX = '.parquet'
+# Conversion records of extracted text files, kept in each Extracted/ directory
+COLUMNAR_MANIFEST_NAME = '.columnar_manifest.json'
+
+# Type names usable in COLUMNAR_SCHEMA_OVERRIDES
+TYPE_NAMES = {
+    'string': lambda: pa.string(),
+    'int64': lambda: pa.int64(),
+    'float64': lambda: pa.float64(),
+    'bool': lambda: pa.bool_(),
+    'date': lambda: pa.date32(),
+    'timestamp': lambda: pa.timestamp('s')
+}
+
+def columnar_available():
+    return pa is not None
+
+def columnar_path(source_path):
+    return os.path.splitext(logical_path(source_path))[0] + COLUMNAR_SUFFIX
+
+def is_current(record, source_path):
+    """True if a recorded conversion still matches its source file and output"""
+    if not record:
+        return False
+    try:
+        stat = os.stat(source_path)
+    except OSError:
+        return False
+    return (record.get('source_size') == stat.st_size
+            and record.get('source_mtime') == stat.st_mtime
+            and os.path.exists(record.get('path', '')))
+
+def sniff_delimiter(path, sample_size=64 * 1024):
+    with open_stored(path, errors='replace') as f:
+        sample = f.read(sample_size)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=',\t|~').delimiter
+    except csv.Error:
+        return ','
+
+def convert_file(source_path, overrides=None, compression=COLUMNAR_COMPRESSION, block_size=COLUMNAR_BLOCK_SIZE):
+    """Stream a delimited text file into a Parquet file beside it.
+
+    Blocks of block_size bytes are parsed and written as row groups one at a
+    time, so memory stays bounded regardless of file size. Column types are
+    inferred from the first block; overrides ({column: type name}) win. If a
+    later block does not fit the inferred types, the file is converted again
+    with the non-overridden columns kept as strings. Returns the conversion
+    record stored in the dataset metadata.
+    """
+    column_types = {name: TYPE_NAMES[type_name]() for name, type_name in (overrides or {}).items()}
+    delimiter = sniff_delimiter(source_path)
+    try:
+        return _write_parquet(source_path, delimiter, column_types, compression, block_size)
+    except pa.ArrowInvalid as e:
+        logging.getLogger(__name__).warning(
+            f"Inferred types do not fit all of {os.path.basename(source_path)} ({str(e)}), "
+            f"converting remaining columns as strings"
+        )
+        header = pa_csv.open_csv(
+            source_path,
+            read_options=pa_csv.ReadOptions(block_size=block_size),
+            parse_options=pa_csv.ParseOptions(delimiter=delimiter)
+        ).schema.names
+        fallback = {name: pa.string() for name in header}
+        fallback.update(column_types)
+        return _write_parquet(source_path, delimiter, fallback, compression, block_size)
+
+def _write_parquet(source_path, delimiter, column_types, compression, block_size):
+    stat = os.stat(source_path)
+    output_path = columnar_path(source_path)
+    temp_path = f"{output_path}.tmp"
+    rows = 0
+    try:
+        reader = pa_csv.open_csv(
+            source_path,
+            read_options=pa_csv.ReadOptions(block_size=block_size),
+            parse_options=pa_csv.ParseOptions(delimiter=delimiter, newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(column_types=column_types, strings_can_be_null=True)
+        )
+        with pq.ParquetWriter(temp_path, reader.schema, compression=compression) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return {
+        'path': output_path,
+        'format': 'parquet',
+        'compression': compression,
+        'rows': rows,
+        'bytes': os.path.getsize(output_path),
+        'sha256': sha256_file(output_path),
+        'schema': {field.name: str(field.type) for field in reader.schema},
+        'source_size': stat.st_size,
+        'source_mtime': stat.st_mtime,
+        'converted_at': datetime.utcnow().isoformat()
+    }
+
+class ColumnarConverter:
+    """Post-ingest stage writing a typed, compressed Parquet copy of each raw file.
+
+    Socrata CSVs record the conversion in <dataset>_metadata.json under
+    'columnar'; extracted FTP/SMS text files record it in the Extracted/
+    columnar manifest, keyed by text file name. The dataset's run manifest
+    decides whether any work is needed: a stage built from the current
+    input hash is skipped.
+    """
+    def __init__(self, base_dir=DATA_DIR):
+        self.base_dir = base_dir
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def convert_socrata(self, dataset_names):
+        """Convert the CSV of every listed dataset; returns the output bytes written"""
+        results = await asyncio.gather(
+            *(self.convert_socrata_dataset(name) for name in dataset_names),
+            return_exceptions=True
+        )
+        written = 0
+        for name, result in zip(dataset_names, results):
+            if isinstance(result, Exception):
+                self.logger.error(f"Columnar conversion of {name} failed: {str(result)}")
+            elif result:
+                written += result['bytes']
+        return {'updated': written > 0, 'bytes': written}
+
+    async def convert_socrata_dataset(self, dataset_name):
+        dataset_dir = os.path.join(self.base_dir, dataset_name)
+        # pyarrow decompresses .gz/.zst sources by their extension
+        source_path = find_stored_file(os.path.join(dataset_dir, f"{dataset_name}.csv"))
+        metadata_file = os.path.join(dataset_dir, f"{dataset_name}_metadata.json")
+        if not source_path:
+            return None
+
+        metadata = read_json(metadata_file)
+        manifest = await asyncio.to_thread(read_manifest, dataset_name, self.base_dir)
+        if manifest.input_sha256:
+            if manifest.is_current('columnar') and os.path.exists(metadata.get('columnar', {}).get('path', '')):
+                return None
+        elif is_current(metadata.get('columnar'), source_path):
+            return None
+
+        record = await self.convert(dataset_name, source_path)
+        metadata['columnar'] = record
+        write_json(metadata_file, metadata)
+        if manifest.input_sha256:
+            await asyncio.to_thread(
+                update_manifest, dataset_name, 'record_output', 'columnar', record['sha256'],
+                manifest.input_sha256, base_dir=self.base_dir,
+                path=record['path'], rows=record['rows'], bytes=record['bytes']
+            )
+        return record
+
+    async def convert_extracted(self, dir_type):
+        """Convert the extracted text files of one source directory (e.g. FTP_Crash or SMS)"""
+        extract_dir = os.path.join(self.base_dir, dir_type, 'Extracted')
+        manifest_path = os.path.join(extract_dir, COLUMNAR_MANIFEST_NAME)
+        run_manifest = await asyncio.to_thread(read_manifest, dir_type, self.base_dir)
+        records = read_json(manifest_path)
+        written = 0
+        changed = False
+        failed = False
+        if run_manifest.is_current('columnar') and all(os.path.exists(r['path']) for r in records.values()):
+            return {'updated': False, 'bytes': 0}
+
+        # Text files from ZipProcessor and from remote extraction alike
+        sources = sorted(
+            item for item in os.listdir(extract_dir) if item.endswith('.txt')
+        ) if os.path.isdir(extract_dir) else []
+        for name in list(records):
+            # Text files superseded by a newer month take their Parquet copy with them
+            if name not in sources:
+                if os.path.exists(records[name]['path']):
+                    os.remove(records[name]['path'])
+                del records[name]
+                changed = True
+        for name in sources:
+            source_path = os.path.join(extract_dir, name)
+            if is_current(records.get(name), source_path):
+                continue
+            try:
+                records[name] = await self.convert(dir_type, source_path)
+                written += records[name]['bytes']
+                changed = True
+            except Exception as e:
+                failed = True
+                self.logger.error(f"Columnar conversion of {name} failed: {str(e)}")
+        if changed:
+            write_json(manifest_path, records)
+        if run_manifest.input_sha256 and not failed:
+            converted = {record['path']: record.get('sha256') for record in records.values()}
+            await asyncio.to_thread(
+                update_manifest, dir_type, 'record_output', 'columnar', None,
+                run_manifest.input_sha256, base_dir=self.base_dir, files=converted
+            )
+        return {'updated': written > 0, 'bytes': written}
+
+    async def convert(self, dataset_name, source_path):
+        self.logger.info(f"Converting {os.path.basename(source_path)} to {COLUMNAR_SUFFIX}")
+        record = await asyncio.to_thread(
+            convert_file, source_path, COLUMNAR_SCHEMA_OVERRIDES.get(dataset_name)
+        )
+        self.logger.info(
+            f"Wrote {os.path.basename(record['path'])}: {record['rows']} rows, "
+            f"{record['bytes'] / (1024 * 1024):.1f}MB"
+        )
+        return record
+
+def read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_json(path, data):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp_path, path)
@@ -8,4 +8,7 @@ class KNIMEError(Exception):
     pass
 
 class FileError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class RangeNotSupportedError(APIError):
+    pass
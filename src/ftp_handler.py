@@ -3,95 +3,279 @@ import asyncio
 import os
 import logging
 import re
-from datetime import datetime
-from ftplib import FTP, error_perm
-from src.error_handler import APIError
-from config.settings import FTP_URL, DATA_DIR
-from src.utils import ProgressBar
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from ftplib import FTP, error_perm, error_temp
+from urllib.parse import urlparse
 import socket
+import hashlib
+from src.error_handler import APIError
+from config.settings import (
+    FTP_URL,
+    DATA_DIR,
+    FTP_POOL_SIZE,
+    FTP_TIMEOUT,
+    FTP_IDLE_TIMEOUT,
+    FTP_LISTING_TTL,
+    DOWNLOAD_MAX_RETRIES,
+    DOWNLOAD_RETRY_DELAY
+)
+from src.utils import ProgressBar, read_part_state, write_part_state, hash_prefix
+from src.run_manifest import RUN_MANIFEST_NAME, update_manifest
+from src.generations import is_publishable
+
+# Directory snapshots shared by all FTPHandler instances: ftp_url -> (fetched_at, entries)
+_listing_cache = {}
+
+class FTPConnectionPool:
+    """Thread-safe pool of logged-in FTP control connections.
+
+    Connections are checked with NOOP before reuse and replaced when the
+    server has dropped them or they sat idle longer than FTP_IDLE_TIMEOUT.
+    A connection that raised while in use is closed instead of returned.
+    """
+    def __init__(self, host, path='', max_size=FTP_POOL_SIZE, timeout=FTP_TIMEOUT):
+        self.host = host
+        self.path = path
+        self.timeout = timeout
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._idle = []  # (ftp, last_used)
+        self._lock = threading.Lock()
+        self._max_size = max_size
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _connect(self):
+        ftp = FTP(self.host, timeout=self.timeout)
+        ftp.set_pasv(True)
+        ftp.login()
+        if self.path:
+            ftp.cwd(self.path)
+        self.logger.debug(f"Opened FTP connection to {self.host}")
+        return ftp
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                ftp, last_used = self._idle.pop()
+            if time.monotonic() - last_used > FTP_IDLE_TIMEOUT:
+                self._close(ftp)
+                continue
+            try:
+                ftp.voidcmd('NOOP')
+                return ftp
+            except Exception:
+                self._close(ftp)
+        return self._connect()
+
+    def _close(self, ftp):
+        try:
+            ftp.quit()
+        except Exception:
+            ftp.close()
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            ftp = self._checkout()
+            try:
+                yield ftp
+            except Exception:
+                self._close(ftp)
+                raise
+            with self._lock:
+                self._idle.append((ftp, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def keepalive(self):
+        """Send NOOP on idle connections, dropping the ones that fail"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        alive = []
+        for ftp, last_used in idle:
+            try:
+                ftp.voidcmd('NOOP')
+                alive.append((ftp, time.monotonic()))
+            except Exception:
+                self._close(ftp)
+        with self._lock:
+            self._idle.extend(alive)
+
+    def close(self):
+        """Close all connections, first waiting for the ones still checked out.
+
+        A worker thread whose awaiting coroutine was cancelled keeps its
+        connection until the FTP call returns (bounded by the socket timeout),
+        so taking every slot here makes sure none is left open behind us.
+        """
+        for _ in range(self._max_size):
+            self._slots.acquire()
+        try:
+            with self._lock:
+                idle, self._idle = self._idle, []
+            for ftp, _ in idle:
+                self._close(ftp)
+        finally:
+            for _ in range(self._max_size):
+                self._slots.release()
 
 class FTPHandler:
-    def __init__(self):
+    def __init__(self, status_tracker=None, timeout=FTP_TIMEOUT):
         self.ftp_url = FTP_URL
         self.base_dir = DATA_DIR
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.status_tracker = status_tracker
+        parsed = urlparse(self.ftp_url)
+        self.pool = FTPConnectionPool(parsed.hostname, parsed.path.strip('/'), timeout=timeout)
+        self._listing_lock = asyncio.Lock()
+
+    def close(self):
+        """Log out of all pooled FTP connections"""
+        self.pool.close()
 
-    async def download_ftp_files(self):
-        updates = []
-        for file_type in ['Crash', 'Inspection', 'Violation']:
-            dataset_name = f'FTP_{file_type}'
-            local_dir = os.path.join(self.base_dir, dataset_name)
+    async def update_file_type(self, file_type):
+        """Fetch the newest archive of one file type; returns True if downloaded"""
+        dataset_name = f'FTP_{file_type}'
+        local_dir = os.path.join(self.base_dir, dataset_name)
+        
+        # Create directory with explicit error handling
+        try:
+            if not os.path.exists(local_dir):
+                os.makedirs(local_dir)
+                self.logger.debug(f"Created directory: {local_dir}")
             
-            # Create directory with explicit error handling
-            try:
-                if not os.path.exists(local_dir):
-                    os.makedirs(local_dir)
-                    self.logger.debug(f"Created directory: {local_dir}")
-                
-                # Create Extracted subdirectory here
-                extract_dir = os.path.join(local_dir, 'Extracted')
-                if not os.path.exists(extract_dir):
-                    os.makedirs(extract_dir)
-                    self.logger.debug(f"Created Extracted directory: {extract_dir}")
-            except PermissionError as pe:
-                self.logger.error(f"Permission error creating directory {local_dir}: {str(pe)}")
-                continue
-            except Exception as e:
-                self.logger.error(f"Error creating directory {local_dir}: {str(e)}")
-                continue
+            # Create Extracted subdirectory here
+            extract_dir = os.path.join(local_dir, 'Extracted')
+            if not os.path.exists(extract_dir):
+                os.makedirs(extract_dir)
+                self.logger.debug(f"Created Extracted directory: {extract_dir}")
+        except PermissionError as pe:
+            self.logger.error(f"Permission error creating directory {local_dir}: {str(pe)}")
+            return False
+        except Exception as e:
+            self.logger.error(f"Error creating directory {local_dir}: {str(e)}")
+            return False
 
-            latest_remote_file = await self.find_latest_file(file_type)
-            if not latest_remote_file:
-                self.logger.info(f"No remote files found for {file_type}")
-                continue
+        # Keep pooled control connections alive between transfers
+        await asyncio.to_thread(self.pool.keepalive)
+
+        latest_remote_file = await self.find_latest_file(file_type)
+        if not latest_remote_file:
+            self.logger.info(f"No remote files found for {file_type}")
+            return False
+
+        latest_local_file = self.find_latest_local_file(local_dir, file_type)
+        if latest_local_file == latest_remote_file:
+            entry = (await self.list_directory()).get(latest_remote_file, {})
+            if self.is_same_file(os.path.join(local_dir, latest_local_file), entry):
+                self.logger.info(f"No update needed for {dataset_name}")
+                return False
+            self.logger.info(f"{latest_remote_file} was republished on the server, downloading again")
+        elif latest_local_file:
+            latest_local_date = self.extract_date_from_filename(latest_local_file)
+            latest_remote_date = self.extract_date_from_filename(latest_remote_file)
+            if latest_local_date and latest_remote_date and latest_remote_date <= latest_local_date:
+                self.logger.info(f"No update needed for {dataset_name}")
+                return False
+
+        # Download the latest file; the previous month stays in place until it has arrived
+        try:
+            size, sha256 = await self.download_file(latest_remote_file, local_dir)
+            self.logger.info(f"Downloaded latest file {latest_remote_file} for {dataset_name}")
+        except Exception as e:
+            self.logger.error(f"Error downloading {latest_remote_file}: {str(e)}")
+            return False
 
-            latest_local_file = self.find_latest_local_file(local_dir, file_type)
-            if latest_local_file:
-                latest_local_date = self.extract_date_from_filename(latest_local_file)
-                latest_remote_date = self.extract_date_from_filename(latest_remote_file)
-                if latest_local_date and latest_remote_date and latest_remote_date <= latest_local_date:
-                    self.logger.info(f"No update needed for {dataset_name}")
+        changed = await asyncio.to_thread(
+            update_manifest, dataset_name, 'record_input', sha256, size,
+            base_dir=self.base_dir, file=latest_remote_file, source=self.ftp_url
+        )
+        if not changed:
+            self.logger.info(f"{latest_remote_file} has identical content to the last run, nothing to do downstream")
+            return False
+
+        # Remove old files with error handling
+        try:
+            for old_file in os.listdir(local_dir):
+                old_file_path = os.path.join(local_dir, old_file)
+                if (old_file == latest_remote_file or old_file.startswith(f"{latest_remote_file}.part")
+                        or old_file.startswith(RUN_MANIFEST_NAME) or not is_publishable(old_file)):
                     continue
+                if os.path.isfile(old_file_path):  # Only remove files, not directories
+                    try:
+                        os.remove(old_file_path)
+                        self.logger.info(f"Removed old file: {old_file}")
+                    except PermissionError as pe:
+                        self.logger.error(f"Permission error removing file {old_file}: {str(pe)}")
+                    except Exception as e:
+                        self.logger.error(f"Error removing file {old_file}: {str(e)}")
+        except Exception as e:
+            self.logger.error(f"Error cleaning directory {local_dir}: {str(e)}")
 
-            # Remove old files with error handling
-            try:
-                for old_file in os.listdir(local_dir):
-                    old_file_path = os.path.join(local_dir, old_file)
-                    if os.path.isfile(old_file_path):  # Only remove files, not directories
-                        try:
-                            os.remove(old_file_path)
-                            self.logger.info(f"Removed old file: {old_file}")
-                        except PermissionError as pe:
-                            self.logger.error(f"Permission error removing file {old_file}: {str(pe)}")
-                        except Exception as e:
-                            self.logger.error(f"Error removing file {old_file}: {str(e)}")
-            except Exception as e:
-                self.logger.error(f"Error cleaning directory {local_dir}: {str(e)}")
-
-            # Download the latest file
-            try:
-                await self.download_file(latest_remote_file, local_dir)
-                updates.append(dataset_name)
-                self.logger.info(f"Downloaded latest file {latest_remote_file} for {dataset_name}")
-            except Exception as e:
-                self.logger.error(f"Error downloading {latest_remote_file}: {str(e)}")
+        return True
+
+    async def list_directory(self):
+        """Snapshot of the remote directory: {name: {'size': int, 'modify': datetime}}.
 
-        return len(updates) > 0
+        Fetched once via MLSD (NLST when the server lacks it, with no size or
+        time) and shared for FTP_LISTING_TTL seconds, so all file types and
+        repeated checks resolve from a single listing.
+        """
+        async with self._listing_lock:
+            cached = _listing_cache.get(self.ftp_url)
+            if cached and time.monotonic() - cached[0] < FTP_LISTING_TTL:
+                return cached[1]
+
+            def ftp_list():
+                with self.pool.connection() as ftp:
+                    try:
+                        entries = {}
+                        for name, facts in ftp.mlsd(facts=['type', 'size', 'modify']):
+                            if facts.get('type', 'file') != 'file':
+                                continue
+                            modify = facts.get('modify')
+                            entries[name] = {
+                                'size': int(facts['size']) if facts.get('size') else None,
+                                'modify': datetime.strptime(modify[:14], '%Y%m%d%H%M%S') if modify else None
+                            }
+                        return entries
+                    except error_perm:
+                        self.logger.debug("MLSD not supported, falling back to NLST")
+                        return {name: {'size': None, 'modify': None} for name in ftp.nlst()}
+
+            entries = await asyncio.to_thread(ftp_list)
+            _listing_cache[self.ftp_url] = (time.monotonic(), entries)
+            return entries
 
     async def find_latest_file(self, file_type):
-        def ftp_list():
-            with FTP('ftp.senture.com') as ftp:
-                ftp.login()
-                files = ftp.nlst()
-                pattern = re.compile(f"{file_type}_\\d{{4}}[A-Za-z]{{3}}\\.zip")
-                valid_files = [f for f in files if pattern.match(f)]
-                if valid_files:
-                    latest_file = max(valid_files, key=lambda x: self.extract_date_from_filename(x))
-                    return latest_file
-                else:
-                    return None
-
-        return await asyncio.to_thread(ftp_list)
+        files = await self.list_directory()
+        pattern = re.compile(f"{file_type}_\\d{{4}}[A-Za-z]{{3}}\\.zip")
+        valid_files = [f for f in files if pattern.match(f)]
+        if valid_files:
+            latest_file = max(valid_files, key=lambda x: self.extract_date_from_filename(x))
+            return latest_file
+        else:
+            return None
+
+    def is_same_file(self, local_path, entry):
+        """Compare a local archive with its listing entry by size and modify time"""
+        try:
+            stat = os.stat(local_path)
+        except OSError:
+            return False
+        if entry.get('size') is not None and stat.st_size != entry['size']:
+            return False
+        if entry.get('modify') is not None:
+            # MLSD times are UTC; downloads stamp the file with the remote time
+            remote_mtime = entry['modify'].replace(tzinfo=timezone.utc).timestamp()
+            if stat.st_mtime < remote_mtime:
+                return False
+        return True
 
     def find_latest_local_file(self, local_dir, file_type):
         local_files = [f for f in os.listdir(local_dir) if f.startswith(f"{file_type}_") and f.endswith('.zip')]
@@ -114,25 +298,87 @@ class FTPHandler:
             return None
 
     async def download_file(self, filename, local_dir):
+        """Download filename into local_dir through a resumable .part file.
+
+        An interrupted transfer is continued with REST from the bytes already
+        in <file>.part, as long as the remote size and modification time still
+        match the ones recorded in the .part.json sidecar. When the server
+        reports neither, the transfer restarts from zero. The finished file replaces the
+        target with os.replace. Returns (size, sha256), hashed during the
+        transfer.
+        """
         local_path = os.path.join(local_dir, filename)
-        progress = ProgressBar(f"Downloading {filename}")
+        part_path = f"{local_path}.part"
+        state_path = f"{part_path}.json"
+        progress = ProgressBar(
+            f"Downloading {filename}",
+            status_tracker=self.status_tracker,
+            dataset_name=filename,
+            source='ftp',
+            metric_dataset=os.path.basename(local_dir)
+        )
+
+        entry = (await self.list_directory()).get(filename, {})
+        remote_modify = entry['modify'].isoformat() if entry.get('modify') is not None else None
 
         def ftp_download():
-            with FTP('ftp.senture.com') as ftp:
-                ftp.set_pasv(True)
-                ftp.login()
-                total_size = 0
-                progress.start()
+            with self.pool.connection() as ftp:
+                ftp.voidcmd('TYPE I')
+                try:
+                    remote_size = ftp.size(filename)
+                except error_perm:
+                    remote_size = None
+                state = read_part_state(state_path)
+                offset = 0
+                validated = remote_size is not None or remote_modify is not None
+                if (validated and state and state.get('remote_size') == remote_size
+                        and state.get('modify') == remote_modify and os.path.exists(part_path)):
+                    offset = os.path.getsize(part_path)
+                    if remote_size is not None and offset > remote_size:
+                        offset = 0
+                write_part_state(state_path, {'filename': filename, 'remote_size': remote_size,
+                                              'modify': remote_modify})
+
+                total_size = offset
+                digest = hash_prefix(part_path) if offset else hashlib.sha256()
+                progress.start(offset)
 
                 def callback(data):
                     nonlocal total_size
                     total_size += len(data)
+                    digest.update(data)
                     progress.update(total_size)
                     return f.write(data)
 
-                with open(local_path, 'wb') as f:
-                    ftp.retrbinary(f"RETR {filename}", callback, blocksize=1024*1024)
-                
-                progress.finish()
+                try:
+                    with open(part_path, 'ab' if offset else 'wb') as f:
+                        if remote_size is None or offset < remote_size:
+                            if offset:
+                                self.logger.info(f"Resuming {filename} at {offset} bytes")
+                            ftp.retrbinary(f"RETR {filename}", callback, blocksize=1024*1024, rest=offset or None)
+                finally:
+                    progress.finish()
+                if remote_size is not None and total_size != remote_size:
+                    raise EOFError(f"Incomplete transfer of {filename}: {total_size} of {remote_size} bytes")
+
+            os.replace(part_path, local_path)
+            os.remove(state_path)
+            return total_size, digest.hexdigest()
 
-        await asyncio.to_thread(ftp_download)
+        attempt = 0
+        while True:
+            try:
+                result = await asyncio.to_thread(ftp_download)
+                if entry.get('modify') is not None:
+                    remote_mtime = entry['modify'].replace(tzinfo=timezone.utc).timestamp()
+                    os.utime(local_path, (remote_mtime, remote_mtime))
+                return result
+            except (OSError, EOFError, error_temp) as e:
+                attempt += 1
+                if attempt > DOWNLOAD_MAX_RETRIES:
+                    raise
+                self.logger.warning(
+                    f"Transfer of {filename} interrupted ({str(e)}), "
+                    f"retry {attempt}/{DOWNLOAD_MAX_RETRIES} in {DOWNLOAD_RETRY_DELAY}s"
+                )
+                await asyncio.sleep(DOWNLOAD_RETRY_DELAY)
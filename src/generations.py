@@ -0,0 +1,183 @@
+# src/generations.py
+import os
+import json
+import shutil
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+try:
+    import _winapi  # Windows only, for directory junctions
+except ImportError:
+    _winapi = None
+
+from config.settings import DATA_DIR, GENERATION_RETENTION
+
+# Inside each dataset directory: generations/<id>/ plus the 'current' pointer
+GENERATIONS_DIR = 'generations'
+CURRENT_LINK = 'current'
+CURRENT_POINTER = 'CURRENT'
+
+# Entries of the working directory that are never published
+RESERVED_NAMES = {GENERATIONS_DIR, CURRENT_LINK, CURRENT_POINTER, f"{CURRENT_LINK}.tmp", f"{CURRENT_POINTER}.tmp"}
+TRANSIENT_SUFFIXES = ('.part', '.part.json', '.tmp', '.merge')
+
+def is_publishable(name: str) -> bool:
+    if name in RESERVED_NAMES or name.startswith('.'):
+        return False
+    return not name.endswith(TRANSIENT_SUFFIXES) and '.page' not in name
+
+class GenerationStore:
+    """Immutable, atomically published snapshots of one dataset directory.
+
+    The updaters keep writing into the dataset's working directory (always
+    via temp file + os.replace, so a working file is never modified in
+    place). publish() snapshots that directory into generations/<id>/,
+    hard-linking data files so unchanged files cost no copy, and then
+    swaps the 'current' symlink with a single rename. Readers such as the
+    KNIME workflow open data/<dataset>/current/... and always see a
+    complete generation. On Windows without symlink rights 'current' is a
+    directory junction instead. JSON files are copied because some are
+    rewritten in place.
+    """
+    def __init__(self, dataset_dir: str, retention: int = GENERATION_RETENTION):
+        self.dataset_dir = dataset_dir
+        self.generations_dir = os.path.join(dataset_dir, GENERATIONS_DIR)
+        self.retention = retention
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def working_files(self) -> List[str]:
+        """Relative paths of the files a generation would contain"""
+        files = []
+        for root, dirs, names in os.walk(self.dataset_dir):
+            dirs[:] = [d for d in dirs if is_publishable(d)]
+            for name in names:
+                if is_publishable(name):
+                    files.append(os.path.relpath(os.path.join(root, name), self.dataset_dir))
+        return sorted(files)
+
+    def current_id(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.dataset_dir, CURRENT_POINTER), 'r') as f:
+                return json.load(f)['generation']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def current_dir(self) -> Optional[str]:
+        generation = self.current_id()
+        return os.path.join(self.generations_dir, generation) if generation else None
+
+    def is_unchanged(self, files: List[str]) -> bool:
+        """True if the current generation already holds exactly these data files.
+
+        JSON bookkeeping (metadata, manifests) is refreshed on every run, so
+        only a change in the data files starts a new generation.
+        """
+        current = self.current_dir()
+        if not current or not os.path.isdir(current):
+            return False
+        published = []
+        for root, _, names in os.walk(current):
+            published.extend(os.path.relpath(os.path.join(root, n), current) for n in names)
+        if sorted(published) != files:
+            return False
+        return all(
+            os.path.samefile(os.path.join(self.dataset_dir, rel), os.path.join(current, rel))
+            for rel in files if not rel.endswith('.json')
+        )
+
+    def publish(self) -> Optional[str]:
+        """Snapshot the working directory as a new generation; returns its id, or None if unchanged"""
+        files = self.working_files()
+        if not files or self.is_unchanged(files):
+            return None
+
+        generation = datetime.utcnow().strftime('%Y%m%dT%H%M%S%fZ')
+        staging = os.path.join(self.generations_dir, f".{generation}.tmp")
+        target = os.path.join(self.generations_dir, generation)
+        os.makedirs(staging, exist_ok=True)
+        try:
+            for rel in files:
+                src = os.path.join(self.dataset_dir, rel)
+                dst = os.path.join(staging, rel)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                if rel.endswith('.json'):
+                    shutil.copy2(src, dst)
+                    continue
+                try:
+                    os.link(src, dst)
+                except OSError:
+                    # Filesystems without hard links fall back to a copy
+                    shutil.copy2(src, dst)
+            os.replace(staging, target)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        self._swap_current(generation)
+        self.logger.info(f"Published {os.path.basename(self.dataset_dir)} generation {generation} ({len(files)} files)")
+        self.prune()
+        return generation
+
+    def _swap_current(self, generation: str):
+        pointer = os.path.join(self.dataset_dir, CURRENT_POINTER)
+        with open(f"{pointer}.tmp", 'w') as f:
+            json.dump({'generation': generation, 'published_at': datetime.utcnow().isoformat()}, f)
+        os.replace(f"{pointer}.tmp", pointer)
+
+        link = os.path.join(self.dataset_dir, CURRENT_LINK)
+        temp_link = f"{link}.tmp"
+        try:
+            if os.path.lexists(temp_link):
+                os.remove(temp_link)
+            os.symlink(os.path.join(GENERATIONS_DIR, generation), temp_link, target_is_directory=True)
+            # rename() replaces the old link itself, never the directory it points to
+            os.replace(temp_link, link)
+        except OSError as e:
+            if _winapi is not None:
+                # Windows without symlink privilege
+                self._swap_junction(generation)
+            else:
+                self.logger.warning(f"Could not update {link} symlink: {str(e)}")
+
+    def _swap_junction(self, generation: str):
+        """Point the 'current' directory junction at generation.
+
+        Junctions need no privilege but cannot be replaced by a rename, so
+        the old one is removed right before the new one is renamed into
+        place; 'current' is briefly missing in between.
+        """
+        link = os.path.join(self.dataset_dir, CURRENT_LINK)
+        temp_link = f"{link}.tmp"
+        try:
+            # rmdir removes a junction (or directory symlink) without touching its target
+            if os.path.lexists(temp_link):
+                os.rmdir(temp_link)
+            _winapi.CreateJunction(os.path.abspath(os.path.join(self.generations_dir, generation)), temp_link)
+            if os.path.lexists(link):
+                os.rmdir(link)
+            os.rename(temp_link, link)
+        except OSError as e:
+            self.logger.warning(f"Could not update {link} junction: {str(e)}")
+
+    def prune(self):
+        """Keep the current generation plus the newest `retention` previous ones"""
+        current = self.current_id()
+        generations = sorted(
+            g for g in os.listdir(self.generations_dir)
+            if not g.startswith('.') and g != current
+        )
+        expired = generations[:max(0, len(generations) - self.retention)]
+        for generation in expired:
+            try:
+                shutil.rmtree(os.path.join(self.generations_dir, generation))
+                self.logger.info(f"Removed generation {generation} of {os.path.basename(self.dataset_dir)}")
+            except OSError as e:
+                # Still open by a reader (Windows); retried on the next publish
+                self.logger.warning(f"Could not remove generation {generation}: {str(e)}")
+
+def publish_dataset(dataset_name: str, base_dir: str = DATA_DIR) -> Optional[str]:
+    dataset_dir = os.path.join(base_dir, dataset_name)
+    if not os.path.isdir(dataset_dir):
+        return None
+    return GenerationStore(dataset_dir).publish()
@@ -0,0 +1,186 @@
+# src/remote_zip.py
+import os
+import struct
+import zlib
+import hashlib
+import logging
+import aiofiles
+from src.error_handler import APIError, RangeNotSupportedError
+
+EOCD_SIGNATURE = b'PK\x05\x06'
+ZIP64_LOCATOR_SIGNATURE = b'PK\x06\x07'
+ZIP64_EOCD_SIGNATURE = b'PK\x06\x06'
+CENTRAL_DIR_SIGNATURE = b'PK\x01\x02'
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+# End of central directory record plus the longest possible archive comment
+EOCD_SEARCH_SIZE = 22 + 65535
+
+class RemoteZip:
+    """Read single members of a ZIP archive over HTTP Range requests.
+
+    Only the end of central directory, the central directory and the bytes
+    of the requested member are transferred. Raises RangeNotSupportedError
+    when the server ignores Range, so callers can fall back to a full download.
+    """
+    def __init__(self, session, url):
+        self.session = session
+        self.url = url
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.entries = None
+
+    async def fetch_range(self, start, end=None):
+        """Return bytes start..end (inclusive); a negative start requests a suffix"""
+        if start < 0:
+            range_header = f"bytes={start}"
+        else:
+            range_header = f"bytes={start}-{end if end is not None else ''}"
+        async with self.session.get(self.url, headers={'Range': range_header}) as response:
+            if response.status != 206:
+                raise RangeNotSupportedError(f"Server returned {response.status} for a Range request to {self.url}")
+            return await response.read()
+
+    async def read_central_directory(self):
+        """Parse the central directory into {name: entry}"""
+        tail = await self.fetch_range(-EOCD_SEARCH_SIZE)
+        eocd_pos = tail.rfind(EOCD_SIGNATURE)
+        if eocd_pos < 0:
+            raise APIError(f"No end of central directory record in {self.url}")
+        (_, _, _, _, entry_count, cd_size, cd_offset, _) = struct.unpack(
+            '<4sHHHHIIH', tail[eocd_pos:eocd_pos + 22]
+        )
+
+        if cd_offset == 0xFFFFFFFF or cd_size == 0xFFFFFFFF or entry_count == 0xFFFF:
+            locator = tail[eocd_pos - 20:eocd_pos]
+            if not locator.startswith(ZIP64_LOCATOR_SIGNATURE):
+                raise APIError(f"Missing ZIP64 locator in {self.url}")
+            zip64_eocd_offset = struct.unpack('<4sIQI', locator)[2]
+            record = await self.fetch_range(zip64_eocd_offset, zip64_eocd_offset + 55)
+            if not record.startswith(ZIP64_EOCD_SIGNATURE):
+                raise APIError(f"Invalid ZIP64 end of central directory in {self.url}")
+            entry_count, cd_size, cd_offset = struct.unpack('<QQQ', record[32:56])
+
+        directory = await self.fetch_range(cd_offset, cd_offset + cd_size - 1)
+        self.entries = {}
+        pos = 0
+        for _ in range(entry_count):
+            if directory[pos:pos + 4] != CENTRAL_DIR_SIGNATURE:
+                raise APIError(f"Corrupt central directory in {self.url}")
+            (_, _, _, flags, method, _, _, crc, compressed_size, file_size,
+             name_len, extra_len, comment_len, _, _, _, header_offset) = struct.unpack(
+                '<4sHHHHHHIIIHHHHHII', directory[pos:pos + 46]
+            )
+            name = directory[pos + 46:pos + 46 + name_len].decode('utf-8' if flags & 0x800 else 'cp437')
+            extra = directory[pos + 46 + name_len:pos + 46 + name_len + extra_len]
+            file_size, compressed_size, header_offset = self._apply_zip64_extra(
+                extra, file_size, compressed_size, header_offset
+            )
+            self.entries[name] = {
+                'name': name,
+                'flags': flags,
+                'method': method,
+                'crc': crc,
+                'compressed_size': compressed_size,
+                'file_size': file_size,
+                'header_offset': header_offset
+            }
+            pos += 46 + name_len + extra_len + comment_len
+        self.cd_offset = cd_offset
+        return self.entries
+
+    def _apply_zip64_extra(self, extra, file_size, compressed_size, header_offset):
+        pos = 0
+        while pos + 4 <= len(extra):
+            header_id, size = struct.unpack('<HH', extra[pos:pos + 4])
+            if header_id == 0x0001:
+                values = extra[pos + 4:pos + 4 + size]
+                index = 0
+                if file_size == 0xFFFFFFFF:
+                    file_size = struct.unpack('<Q', values[index:index + 8])[0]
+                    index += 8
+                if compressed_size == 0xFFFFFFFF:
+                    compressed_size = struct.unpack('<Q', values[index:index + 8])[0]
+                    index += 8
+                if header_offset == 0xFFFFFFFF:
+                    header_offset = struct.unpack('<Q', values[index:index + 8])[0]
+                break
+            pos += 4 + size
+        return file_size, compressed_size, header_offset
+
+    async def find_member(self, member_name):
+        """Case-insensitive lookup of a member, as ZipProcessor matches them"""
+        if self.entries is None:
+            await self.read_central_directory()
+        target_lower = member_name.lower()
+        for name, entry in self.entries.items():
+            if name.lower() == target_lower:
+                return entry
+        return None
+
+    async def extract_member(self, member_name, output_path, progress=None):
+        """Stream one member straight into output_path; returns its entry or None if absent.
+
+        The returned entry also carries the SHA-256 of the extracted bytes.
+        """
+        entry = await self.find_member(member_name)
+        if not entry:
+            return None
+        if entry['flags'] & 0x1:
+            raise APIError(f"{entry['name']} in {self.url} is encrypted")
+        if entry['method'] not in (0, 8):
+            raise APIError(f"Unsupported compression method {entry['method']} for {entry['name']}")
+
+        start = entry['header_offset']
+        header_end = start + 30 + 65535 * 2 + entry['compressed_size'] - 1
+        range_header = f"bytes={start}-{min(header_end, self.cd_offset - 1)}"
+        decompressor = zlib.decompressobj(-15) if entry['method'] == 8 else None
+        crc = 0
+        digest = hashlib.sha256()
+        written = 0
+        part_path = f"{output_path}.part"
+
+        try:
+            async with self.session.get(self.url, headers={'Range': range_header}) as response:
+                if response.status != 206:
+                    raise RangeNotSupportedError(f"Server returned {response.status} for a Range request to {self.url}")
+                header = await response.content.readexactly(30)
+                if not header.startswith(LOCAL_HEADER_SIGNATURE):
+                    raise APIError(f"Invalid local header for {entry['name']} in {self.url}")
+                name_len, extra_len = struct.unpack('<HH', header[26:30])
+                await response.content.readexactly(name_len + extra_len)
+
+                remaining = entry['compressed_size']
+                if progress:
+                    progress.start()
+                async with aiofiles.open(part_path, 'wb') as f:
+                    while remaining > 0:
+                        chunk = await response.content.read(min(1024 * 1024, remaining))
+                        if not chunk:
+                            raise APIError(f"Connection closed while reading {entry['name']} from {self.url}")
+                        remaining -= len(chunk)
+                        data = decompressor.decompress(chunk) if decompressor else chunk
+                        if remaining == 0 and decompressor:
+                            data += decompressor.flush()
+                        crc = zlib.crc32(data, crc)
+                        digest.update(data)
+                        written += len(data)
+                        await f.write(data)
+                        if progress:
+                            progress.update(entry['compressed_size'] - remaining)
+        except Exception:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        finally:
+            if progress:
+                progress.finish()
+
+        if written != entry['file_size'] or crc != entry['crc']:
+            os.remove(part_path)
+            raise APIError(f"Checksum mismatch extracting {entry['name']} from {self.url}")
+        os.replace(part_path, output_path)
+        entry = dict(entry, sha256=digest.hexdigest())
+        self.logger.info(
+            f"Extracted {entry['name']} ({entry['compressed_size']} bytes transferred) to {output_path}"
+        )
+        return entry
@@ -0,0 +1,124 @@
+# src/run_manifest.py
+import os
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config.settings import DATA_DIR, RUN_MANIFEST_HISTORY
+
+# Per-dataset manifest, kept in the dataset's directory
+RUN_MANIFEST_NAME = 'run_manifest.json'
+
+logger = logging.getLogger(__name__)
+
+# Serialises read-modify-write of a manifest across stages and FTP worker threads
+_manifest_lock = threading.Lock()
+
+def manifest_path(dataset_name: str, base_dir: str = DATA_DIR) -> str:
+    return os.path.join(base_dir, dataset_name, RUN_MANIFEST_NAME)
+
+def sha256_file(path: str, open_func=open, chunk_size: int = 8 * 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open_func(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class RunManifest:
+    """Content-addressed record of one dataset's input and derived outputs.
+
+    'input' holds the SHA-256, size and row count of the latest upstream
+    file; 'outputs' maps a stage name (extract, columnar, knime, ...) to
+    the input hash it was produced from plus its own hash. A stage is up
+    to date when its recorded input_sha256 equals the current input hash.
+    'history' is a bounded audit trail of recorded inputs and outputs.
+    """
+    def __init__(self, dataset_name: str, base_dir: str = DATA_DIR):
+        self.dataset_name = dataset_name
+        self.path = manifest_path(dataset_name, base_dir)
+        self.data = self._load()
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data.setdefault('dataset', self.dataset_name)
+        data.setdefault('input', None)
+        data.setdefault('outputs', {})
+        data.setdefault('history', [])
+        return data
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    @property
+    def input_sha256(self) -> Optional[str]:
+        return (self.data['input'] or {}).get('sha256')
+
+    def input_unchanged(self, sha256: str) -> bool:
+        return sha256 is not None and sha256 == self.input_sha256
+
+    def is_current(self, stage: str, input_sha256: Optional[str] = None) -> bool:
+        """True if stage's output was built from input_sha256 (default: the current input)"""
+        input_sha256 = input_sha256 or self.input_sha256
+        output = self.data['outputs'].get(stage)
+        return bool(input_sha256 and output and output.get('input_sha256') == input_sha256)
+
+    def record_input(self, sha256: str, size: int, rows: Optional[int] = None, **details) -> bool:
+        """Record the upstream file of this run; returns True if its content changed"""
+        changed = not self.input_unchanged(sha256)
+        entry = dict(details, sha256=sha256, size=size, recorded_at=datetime.utcnow().isoformat())
+        if rows is not None:
+            entry['rows'] = rows
+        elif not changed and self.data['input']:
+            entry.setdefault('rows', self.data['input'].get('rows'))
+        self.data['input'] = entry
+        self._audit('input', sha256, changed=changed)
+        self.save()
+        return changed
+
+    def record_output(self, stage: str, sha256: Optional[str] = None, input_sha256: Optional[str] = None,
+                      **details):
+        """Record that stage produced an output from input_sha256 (default: the current input)"""
+        input_sha256 = input_sha256 or self.input_sha256
+        self.data['outputs'][stage] = dict(
+            details, input_sha256=input_sha256, sha256=sha256, recorded_at=datetime.utcnow().isoformat()
+        )
+        self._audit(stage, sha256, input_sha256=input_sha256)
+        self.save()
+
+    def _audit(self, stage: str, sha256: Optional[str], **details):
+        self.data['history'].append(dict(details, stage=stage, sha256=sha256, at=datetime.utcnow().isoformat()))
+        del self.data['history'][:-RUN_MANIFEST_HISTORY]
+
+def update_manifest(dataset_name: str, method: str, *args, base_dir: str = DATA_DIR, **kwargs):
+    """Load, update and save one manifest under the module lock; returns the method's result"""
+    with _manifest_lock:
+        manifest = RunManifest(dataset_name, base_dir)
+        return getattr(manifest, method)(*args, **kwargs)
+
+def read_manifest(dataset_name: str, base_dir: str = DATA_DIR) -> RunManifest:
+    with _manifest_lock:
+        return RunManifest(dataset_name, base_dir)
+
+def stale_datasets(stage: str, dataset_names: List[str], base_dir: str = DATA_DIR) -> List[str]:
+    """Datasets whose current input has not been through stage yet.
+
+    A dataset without a manifest or without a recorded input hash counts
+    as stale, since nothing shows stage ever ran on its data.
+    """
+    stale = []
+    for name in dataset_names:
+        manifest = read_manifest(name, base_dir)
+        if not manifest.input_sha256 or not manifest.is_current(stage):
+            stale.append(name)
+    return stale
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional
+
+from config.settings import SSE_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+class Subscription:
+    """One SSE client: a bounded queue of status events plus coalesced progress.
+
+    Progress ticks only overwrite the latest value per dataset, so a burst of
+    ticks becomes a single delta however slowly the client reads.
+    """
+    def __init__(self, max_size: int = SSE_QUEUE_SIZE):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.progress: Dict[str, Optional[Dict]] = {}
+        self.wake = asyncio.Event()
+        self.closed = False
+
+    def take_progress(self) -> Dict[str, Optional[Dict]]:
+        progress, self.progress = self.progress, {}
+        return progress
+
+class EventBus:
+    """In-process publish/subscribe for status and progress events.
+
+    publish_* may be called from any thread (FTP transfers report progress
+    from worker threads); delivery always happens on the event loop that
+    the subscribers live on. With no subscribers publishing is a no-op.
+    """
+    def __init__(self):
+        self.subscribers = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, max_size: int = SSE_QUEUE_SIZE) -> Subscription:
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(max_size)
+        with self._lock:
+            self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscription.closed = True
+        with self._lock:
+            self.subscribers.discard(subscription)
+
+    def publish_progress(self, dataset_name: str, progress: Optional[Dict]):
+        """Latest progress for a dataset; None means the download finished"""
+        self._dispatch(self._deliver_progress, dataset_name, progress)
+
+    def publish_status(self, event: Dict):
+        self._dispatch(self._deliver_status, event)
+
+    def _dispatch(self, deliver, *args):
+        if not self.subscribers or self._loop is None or self._loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            deliver(*args)
+        else:
+            self._loop.call_soon_threadsafe(deliver, *args)
+
+    def _deliver_progress(self, dataset_name, progress):
+        with self._lock:
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            subscription.progress[dataset_name] = progress
+            subscription.wake.set()
+
+    def _deliver_status(self, event):
+        with self._lock:
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow consumer: drop it; EventSource reconnects and gets a fresh snapshot
+                logger.warning("Dropping slow event stream subscriber")
+                self.unsubscribe(subscription)
+            subscription.wake.set()
+
+# Single bus shared by the status tracker and the SSE endpoint
+event_bus = EventBus()
@@ -0,0 +1,180 @@
+import json
+import os
+import sqlite3
+import threading
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class HistoryStore:
+    """Append-only SQLite store for update history events.
+
+    Uses the update_history table layout of core/database/models.UpdateHistory
+    through the standard library sqlite3 module, with indexes on type and
+    timestamp. Appends are single INSERTs regardless of history size.
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS update_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    dataset_name TEXT,
+                    update_type TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    details TEXT
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_update_history_type_timestamp ON update_history (update_type, timestamp)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_update_history_timestamp ON update_history (timestamp)"
+            )
+            # Legacy JSON files already imported, so the import never runs twice
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS history_migrations (
+                    source TEXT PRIMARY KEY,
+                    entries INTEGER NOT NULL,
+                    migrated_at TEXT NOT NULL
+                )
+            """)
+
+    def _row_to_entry(self, row) -> Dict:
+        return {
+            "id": row["id"],
+            "type": row["update_type"],
+            "status": row["status"],
+            "timestamp": row["timestamp"],
+            "details": json.loads(row["details"]) if row["details"] else {}
+        }
+
+    def append(self, entry: Dict) -> int:
+        details = entry.get("details") or {}
+        dataset_name = details.get("dataset") if isinstance(details, dict) else None
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO update_history (dataset_name, update_type, status, timestamp, details) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (dataset_name, entry["type"], entry["status"], entry["timestamp"], json.dumps(details))
+            )
+            return cursor.lastrowid
+
+    def query(self, limit: int = 50, offset: int = 0, update_type: Optional[str] = None,
+              status: Optional[str] = None, since: Optional[str] = None,
+              until: Optional[str] = None) -> List[Dict]:
+        """Newest-first page of events matching the optional filters"""
+        clauses, params = [], []
+        if update_type:
+            clauses.append("update_type = ?")
+            params.append(update_type)
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM update_history {where} ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+                (*params, limit, offset)
+            ).fetchall()
+        return [self._row_to_entry(row) for row in rows]
+
+    def latest_per_type(self) -> Dict[str, Dict]:
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT h.* FROM update_history h
+                JOIN (SELECT update_type, MAX(timestamp) AS ts FROM update_history GROUP BY update_type) m
+                  ON h.update_type = m.update_type AND h.timestamp = m.ts
+                ORDER BY h.id
+            """).fetchall()
+        return {row["update_type"]: self._row_to_entry(row) for row in rows}
+
+    def migrate_json(self, json_path: str) -> int:
+        """One-time import of the legacy update_history.json.
+
+        The file is left in place (it is tracked in git); the import is
+        recorded in history_migrations so it never runs twice. Returns the
+        number of imported events.
+        """
+        source = os.path.abspath(json_path)
+        with self._lock:
+            migrated = self._conn.execute(
+                "SELECT 1 FROM history_migrations WHERE source = ?", (source,)
+            ).fetchone()
+        if migrated or not os.path.exists(json_path):
+            return 0
+        if os.path.exists(f"{json_path}.migrated"):
+            # Imported by an earlier version that renamed the file afterwards
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO history_migrations (source, entries, migrated_at) VALUES (?, 0, ?)",
+                    (source, datetime.utcnow().isoformat())
+                )
+            return 0
+        try:
+            with open(json_path, 'r') as f:
+                history = json.load(f)
+        except Exception as e:
+            logger.error(f"Error reading legacy history {json_path}: {e}")
+            return 0
+
+        rows = []
+        for entry in history:
+            details = entry.get("details") or {}
+            rows.append((
+                details.get("dataset") if isinstance(details, dict) else None,
+                entry.get("type"),
+                entry.get("status"),
+                entry.get("timestamp"),
+                json.dumps(details)
+            ))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO update_history (dataset_name, update_type, status, timestamp, details) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.execute(
+                "INSERT INTO history_migrations (source, entries, migrated_at) VALUES (?, ?, ?)",
+                (source, len(rows), datetime.utcnow().isoformat())
+            )
+        logger.info(f"Migrated {len(rows)} history entries from {json_path} to {self.db_path}")
+        return len(rows)
+
+    def compact(self, retention_days: Optional[int] = None, max_entries: Optional[int] = None) -> int:
+        """Drop events older than retention_days and beyond the newest max_entries"""
+        removed = 0
+        with self._lock, self._conn:
+            if retention_days:
+                cutoff = (datetime.utcnow() - timedelta(days=retention_days)).isoformat()
+                removed += self._conn.execute(
+                    "DELETE FROM update_history WHERE timestamp < ?", (cutoff,)
+                ).rowcount
+            if max_entries:
+                removed += self._conn.execute("""
+                    DELETE FROM update_history WHERE id NOT IN (
+                        SELECT id FROM update_history ORDER BY timestamp DESC, id DESC LIMIT ?
+                    )
+                """, (max_entries,)).rowcount
+        if removed:
+            logger.info(f"Compacted update history, removed {removed} entries")
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
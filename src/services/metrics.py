@@ -0,0 +1,163 @@
+import math
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Default histogram buckets
+DURATION_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 300, 900, 1800, 3600)
+BYTES_BUCKETS = tuple(2 ** n for n in range(16, 36, 2))  # 64KB .. 16GB
+RATE_BUCKETS = tuple(n * 1024 * 1024 for n in (0.1, 0.5, 1, 2, 5, 10, 25, 50, 100))
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+def _label_key(labels: Dict[str, str]) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(key: Tuple, extra: Tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    """Base for a labelled metric; values are kept per label set under a lock"""
+    type_name = "untyped"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type_name}"]
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in values.items()]
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in values.items()]
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, description: str, buckets=DURATION_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = {k: {"counts": list(v["counts"]), "sum": v["sum"], "count": v["count"]}
+                      for k, v in self._values.items()}
+        lines = self.header()
+        for key, state in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {state['count']}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+download_bytes = registry.register(Counter(
+    "loadguard_download_bytes_total", "Bytes downloaded per source and dataset"))
+download_duration = registry.register(Histogram(
+    "loadguard_download_duration_seconds", "Duration of download attempts", DURATION_BUCKETS))
+download_rate = registry.register(Histogram(
+    "loadguard_download_rate_bytes_per_second", "Average transfer rate of download attempts", RATE_BUCKETS))
+zip_extraction_duration = registry.register(Histogram(
+    "loadguard_zip_extraction_duration_seconds", "Time to extract one archive", DURATION_BUCKETS))
+zip_extraction_bytes = registry.register(Histogram(
+    "loadguard_zip_extraction_bytes", "Bytes extracted per archive", BYTES_BUCKETS))
+stage_duration = registry.register(Histogram(
+    "loadguard_pipeline_stage_duration_seconds", "Duration of update pipeline stages", DURATION_BUCKETS))
+scheduler_job_runs = registry.register(Counter(
+    "loadguard_scheduler_job_runs_total", "Scheduled job executions"))
+scheduler_job_failures = registry.register(Counter(
+    "loadguard_scheduler_job_failures_total", "Scheduled job executions that failed"))
+knime_click_duration = registry.register(Histogram(
+    "loadguard_knime_click_duration_seconds", "Duration of KNIME click sequences", DURATION_BUCKETS))
+event_loop_lag = registry.register(Histogram(
+    "loadguard_event_loop_lag_seconds", "Delay of event loop wakeups beyond their schedule", LAG_BUCKETS))
+event_loop_lag_last = registry.register(Gauge(
+    "loadguard_event_loop_lag_last_seconds", "Most recent event loop lag sample"))
+version_chunk_bytes = registry.register(Counter(
+    "loadguard_version_store_chunk_bytes_total", "Uncompressed bytes snapshotted into the version store, new or deduplicated"))
+
+def record_download(source: str, dataset: str, size: int, duration: float):
+    """Record one finished (or interrupted) transfer"""
+    if size <= 0:
+        return
+    download_bytes.inc(size, source=source, dataset=dataset)
+    download_duration.observe(duration, source=source, dataset=dataset)
+    if duration > 0:
+        download_rate.observe(size / duration, source=source, dataset=dataset)
+
+async def monitor_event_loop_lag(interval: float = 1.0):
+    """Sample how late the loop wakes a sleeping task; runs until cancelled"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - expected)
+        event_loop_lag.observe(lag)
+        event_loop_lag_last.set(lag)
@@ -1,49 +1,85 @@
-import json
 import os
+import threading
+from collections import deque
 from datetime import datetime
 from typing import Dict, List, Optional
 import logging
+from config.settings import (
+    STATUS_DB_FILE,
+    LEGACY_HISTORY_FILE,
+    HISTORY_RETENTION_DAYS,
+    HISTORY_MAX_ENTRIES,
+    HISTORY_COMPACT_EVERY,
+    HISTORY_RECENT_BUFFER
+)
+from src.services.history_store import HistoryStore
 
 logger = logging.getLogger(__name__)
 
 class StatusTracker:
-    def __init__(self):
-        self.status_file = "update_history.json"
-        self.history: List[Dict] = []
+    """Update history and live download progress.
+
+    Use the shared instance from src.services.status_tracker_instance;
+    progress is written from the event loop and from FTP worker threads,
+    so all in-memory state is guarded by one lock and read as copies.
+    """
+    def __init__(self, db_file: str = STATUS_DB_FILE, event_bus=None):
+        self.store = HistoryStore(db_file)
+        # Optional EventBus notified of every progress tick and logged update
+        self.event_bus = event_bus
+        self._lock = threading.Lock()
         self.current_progress: Dict = {}  # Store current download progress
+        self._appends_since_compact = 0
+        # Latest event per type and a bounded, oldest-first buffer of recent events,
+        # both maintained by log_update so reads never scan or sort the history
+        self.latest_by_type: Dict[str, Dict] = {}
+        self.recent: deque = deque(maxlen=HISTORY_RECENT_BUFFER)
         self.load_history()
 
     def load_history(self):
-        """Load update history from file if it exists"""
+        """Migrate the legacy JSON history once, apply retention and warm the indexes"""
         try:
-            if os.path.exists(self.status_file):
-                with open(self.status_file, 'r') as f:
-                    self.history = json.load(f)
+            # Older versions wrote update_history.json to the working directory
+            for legacy_file in {LEGACY_HISTORY_FILE, os.path.abspath("update_history.json")}:
+                self.store.migrate_json(legacy_file)
+            self.compact()
+            self.latest_by_type = self.store.latest_per_type()
+            self.recent.extend(reversed(self.store.query(limit=HISTORY_RECENT_BUFFER)))
         except Exception as e:
             logger.error(f"Error loading history: {e}")
-            self.history = []
 
-    def save_history(self):
-        """Save update history to file"""
+    def compact(self):
+        """Apply HISTORY_RETENTION_DAYS and HISTORY_MAX_ENTRIES"""
         try:
-            with open(self.status_file, 'w') as f:
-                json.dump(self.history, f, indent=2)
+            self.store.compact(HISTORY_RETENTION_DAYS, HISTORY_MAX_ENTRIES)
         except Exception as e:
-            logger.error(f"Error saving history: {e}")
+            logger.error(f"Error compacting history: {e}")
+        self._appends_since_compact = 0
 
     def update_progress(self, dataset_name: str, downloaded: float, speed: float):
         """Update current download progress"""
-        self.current_progress[dataset_name] = {
+        progress = {
             "status": "downloading",
             "progress": f"{downloaded:.1f}MB",
             "speed": f"{speed:.1f}MB/s",
             "timestamp": datetime.utcnow().isoformat()
         }
+        with self._lock:
+            self.current_progress[dataset_name] = progress
+        if self.event_bus:
+            self.event_bus.publish_progress(dataset_name, dict(progress))
 
     def clear_progress(self, dataset_name: str):
         """Clear progress for a dataset"""
-        if dataset_name in self.current_progress:
-            del self.current_progress[dataset_name]
+        with self._lock:
+            cleared = self.current_progress.pop(dataset_name, None)
+        if cleared is not None and self.event_bus:
+            self.event_bus.publish_progress(dataset_name, None)
+
+    def get_progress(self) -> Dict:
+        """Snapshot of the downloads currently in progress"""
+        with self._lock:
+            return {name: dict(progress) for name, progress in self.current_progress.items()}
 
     def log_update(self, update_type: str, status: str, details: Dict):
         """Log an update event"""
@@ -53,30 +89,51 @@ class StatusTracker:
             "timestamp": datetime.utcnow().isoformat(),
             "details": details
         }
-        self.history.append(update_log)
-        self.save_history()
+        try:
+            update_log["id"] = self.store.append(update_log)
+        except Exception as e:
+            logger.error(f"Error saving history: {e}")
+        with self._lock:
+            self.latest_by_type[update_type] = update_log
+            self.recent.append(update_log)
+            self._appends_since_compact += 1
+            compact = self._appends_since_compact >= HISTORY_COMPACT_EVERY
+        if compact:
+            self.compact()
+        if self.event_bus:
+            self.event_bus.publish_status(update_log)
         return update_log
 
     def get_recent_updates(self, limit: int = 10) -> List[Dict]:
         """Get the most recent updates and current progress"""
-        updates = sorted(
-            self.history,
-            key=lambda x: x["timestamp"],
-            reverse=True
-        )[:limit]
-        
+        with self._lock:
+            if limit <= len(self.recent) or len(self.recent) < (self.recent.maxlen or 0):
+                # Served from the ring buffer, newest first
+                updates = [self.recent[-i] for i in range(1, min(limit, len(self.recent)) + 1)]
+            else:
+                updates = None
+        if updates is None:
+            updates = self.store.query(limit=limit)
+
         # Include current progress if any
-        if self.current_progress:
+        current_progress = self.get_progress()
+        if current_progress:
             updates.insert(0, {
                 "type": "in_progress",
                 "status": "downloading",
                 "timestamp": datetime.utcnow().isoformat(),
-                "details": self.current_progress
+                "details": current_progress
             })
         
         return updates
 
     def get_latest_status(self, update_type: str) -> Optional[Dict]:
         """Get the latest status for a specific update type"""
-        updates = [u for u in self.history if u["type"] == update_type]
-        return max(updates, key=lambda x: x["timestamp"]) if updates else None 
\ No newline at end of file
+        with self._lock:
+            return self.latest_by_type.get(update_type)
+
+    def query_history(self, limit: int = 50, offset: int = 0, update_type: Optional[str] = None,
+                      status: Optional[str] = None, since: Optional[str] = None,
+                      until: Optional[str] = None) -> List[Dict]:
+        """Paginated, filtered history, newest first"""
+        return self.store.query(limit, offset, update_type, status, since, until)
@@ -0,0 +1,5 @@
+from src.services.status_tracker import StatusTracker
+from src.services.event_bus import event_bus
+
+# Single status tracker shared by all routers, the scheduler and the updaters
+status_tracker = StatusTracker(event_bus=event_bus)
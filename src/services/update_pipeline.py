@@ -0,0 +1,248 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from functools import partial
+from typing import Callable, Dict, List, Optional
+
+import aiohttp
+
+from config.settings import (
+    DATA_DIR,
+    PIPELINE_WORKERS,
+    COLUMNAR_ENABLED,
+    GENERATIONS_ENABLED,
+    VERSION_STORE_ENABLED
+)
+from src.socrata_updater import SocrataUpdater
+from src.sms_handler import SMSHandler
+from src.ftp_handler import FTPHandler
+from src.zip_processor import ZipProcessor
+from src.columnar_converter import ColumnarConverter, columnar_available
+from src.generations import GENERATIONS_DIR, publish_dataset
+from src.version_store import archive_dataset
+from src.services.metrics import stage_duration
+
+logger = logging.getLogger(__name__)
+
+FTP_FILE_TYPES = ['Crash', 'Inspection', 'Violation']
+
+class PipelineNode:
+    """One step of the update graph.
+
+    func is an async callable returning a truthy value when it changed
+    something, or a dict with 'updated' and optionally 'bytes'/'rows'.
+    output_dirs, when set, are scanned after the node finishes to report
+    the bytes it wrote if func did not report them itself. source names
+    the data source (socrata, sms, ftp) the node's outcome is reported under.
+    """
+    def __init__(self, name: str, func: Callable, depends_on: Optional[List[str]] = None,
+                 output_dirs: Optional[List[str]] = None, source: Optional[str] = None):
+        self.name = name
+        self.func = func
+        self.depends_on = list(depends_on or [])
+        self.output_dirs = list(output_dirs or [])
+        self.source = source
+
+class Pipeline:
+    """Run declared nodes as soon as their dependencies have finished.
+
+    Independent nodes run concurrently (at most max_concurrency at once).
+    A node runs after its dependencies even if one of them failed, so
+    downstream stages can still work from the previous good inputs.
+    """
+    def __init__(self, max_concurrency: int = PIPELINE_WORKERS):
+        self.nodes: Dict[str, PipelineNode] = {}
+        self.max_concurrency = max_concurrency
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def add(self, name: str, func: Callable, depends_on: Optional[List[str]] = None,
+            output_dirs: Optional[List[str]] = None, source: Optional[str] = None):
+        if name in self.nodes:
+            raise ValueError(f"Duplicate pipeline node: {name}")
+        self.nodes[name] = PipelineNode(name, func, depends_on, output_dirs, source)
+        return self.nodes[name]
+
+    def validate(self):
+        """Reject unknown dependencies and cycles"""
+        for node in self.nodes.values():
+            for dep in node.depends_on:
+                if dep not in self.nodes:
+                    raise ValueError(f"Node {node.name} depends on unknown node {dep}")
+        visiting, done = set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle in pipeline at node {name}")
+            visiting.add(name)
+            for dep in self.nodes[name].depends_on:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.nodes:
+            visit(name)
+
+    async def run(self) -> Dict[str, Dict]:
+        """Run the graph; returns per-node stats keyed by node name"""
+        self.validate()
+        limit = asyncio.Semaphore(max(1, self.max_concurrency))
+        finished = {name: asyncio.Event() for name in self.nodes}
+        stats: Dict[str, Dict] = {}
+
+        async def run_node(node: PipelineNode):
+            for dep in node.depends_on:
+                await finished[dep].wait()
+            async with limit:
+                started_at = datetime.utcnow()
+                start = time.perf_counter()
+                record = {
+                    "started_at": started_at.isoformat(),
+                    "depends_on": node.depends_on,
+                    "source": node.source
+                }
+                try:
+                    result = await node.func()
+                    if isinstance(result, dict):
+                        record.update({k: result[k] for k in ("bytes", "rows") if result.get(k) is not None})
+                        result = bool(result.get("updated"))
+                    record["status"] = "updated" if result else "unchanged"
+                    record["result"] = bool(result)
+                except Exception as e:
+                    self.logger.error(f"Pipeline node {node.name} failed: {str(e)}")
+                    record["status"] = "failed"
+                    record["result"] = False
+                    record["error"] = str(e)
+                record["ended_at"] = datetime.utcnow().isoformat()
+                record["duration"] = round(time.perf_counter() - start, 3)
+                stage_duration.observe(record["duration"], stage=node.name, status=record["status"])
+                if node.output_dirs and "bytes" not in record:
+                    record["bytes"] = await asyncio.to_thread(
+                        bytes_written_since, node.output_dirs, started_at.timestamp()
+                    )
+                stats[node.name] = record
+            finished[node.name].set()
+
+        await asyncio.gather(*(run_node(node) for node in self.nodes.values()))
+        return {name: stats[name] for name in self.nodes}
+
+def bytes_written_since(paths, since):
+    """Total size of files under paths modified at or after since (epoch seconds)"""
+    total = 0
+    for path in paths:
+        for root, dirs, files in os.walk(path):
+            # Published generations only hard-link files already counted
+            dirs[:] = [d for d in dirs if d != GENERATIONS_DIR]
+            for name in files:
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                if stat.st_mtime >= since:
+                    total += stat.st_size
+    return total
+
+def build_update_pipeline(session, ftp_handler, zip_processor, status_tracker=None) -> Pipeline:
+    """The dataset update graph shared by the scheduler, run_update.py and the API"""
+    socrata_updater = SocrataUpdater(session, status_tracker)
+    sms_handler = SMSHandler(session, status_tracker)
+
+    async def extract(dir_type):
+        updated = await zip_processor.process_directory(dir_type)
+        return dict(zip_processor.last_stats.get(dir_type, {}), updated=updated)
+
+    pipeline = Pipeline()
+    pipeline.add("socrata", socrata_updater.update_and_download_datasets,
+                 output_dirs=[os.path.join(DATA_DIR, name) for name in socrata_updater.datasets], source="socrata")
+    pipeline.add("sms", sms_handler.download_latest_sms_file, output_dirs=[sms_handler.base_dir], source="sms")
+    pipeline.add("extract_SMS", partial(extract, "SMS"), depends_on=["sms"], source="sms")
+    for file_type in FTP_FILE_TYPES:
+        dir_type = f"FTP_{file_type}"
+        pipeline.add(f"ftp_{file_type}", partial(ftp_handler.update_file_type, file_type),
+                     output_dirs=[os.path.join(DATA_DIR, dir_type)], source="ftp")
+        pipeline.add(f"extract_{dir_type}", partial(extract, dir_type), depends_on=[f"ftp_{file_type}"],
+                     source="ftp")
+
+    if COLUMNAR_ENABLED:
+        if columnar_available():
+            converter = ColumnarConverter(DATA_DIR)
+            pipeline.add("columnar_socrata", partial(converter.convert_socrata, list(socrata_updater.datasets)),
+                         depends_on=["socrata"], source="socrata")
+            for dir_type in ["SMS"] + [f"FTP_{t}" for t in FTP_FILE_TYPES]:
+                pipeline.add(f"columnar_{dir_type}", partial(converter.convert_extracted, dir_type),
+                             depends_on=[f"extract_{dir_type}"], source=source_of(dir_type))
+        else:
+            logger.warning("COLUMNAR_ENABLED is set but pyarrow is not installed, skipping columnar conversion")
+
+    if GENERATIONS_ENABLED:
+        # Publish each dataset once everything that writes to it has finished
+        async def publish(dataset_names):
+            published = await asyncio.gather(
+                *(asyncio.to_thread(publish_dataset, name) for name in dataset_names)
+            )
+            return any(published)
+
+        pipeline.add("publish_socrata", partial(publish, list(socrata_updater.datasets)),
+                     depends_on=[n for n in ("socrata", "columnar_socrata") if n in pipeline.nodes],
+                     source="socrata")
+        for dir_type in ["SMS"] + [f"FTP_{t}" for t in FTP_FILE_TYPES]:
+            pipeline.add(f"publish_{dir_type}", partial(publish, [dir_type]),
+                         depends_on=[n for n in (f"extract_{dir_type}", f"columnar_{dir_type}") if n in pipeline.nodes],
+                         source=source_of(dir_type))
+
+    if VERSION_STORE_ENABLED:
+        # Keep the published state of each dataset in the chunk-deduplicated version history
+        async def archive(dataset_names):
+            summaries = await asyncio.gather(
+                *(asyncio.to_thread(archive_dataset, name) for name in dataset_names)
+            )
+            return {
+                "updated": any(summaries),
+                "bytes": sum(summary["stored_bytes"] for summary in summaries if summary)
+            }
+
+        pipeline.add("archive_socrata", partial(archive, list(socrata_updater.datasets)),
+                     depends_on=[n for n in ("publish_socrata", "socrata", "columnar_socrata") if n in pipeline.nodes],
+                     source="socrata")
+        for dir_type in ["SMS"] + [f"FTP_{t}" for t in FTP_FILE_TYPES]:
+            pipeline.add(f"archive_{dir_type}", partial(archive, [dir_type]),
+                         depends_on=[n for n in (f"publish_{dir_type}", f"extract_{dir_type}", f"columnar_{dir_type}")
+                                     if n in pipeline.nodes],
+                         source=source_of(dir_type))
+    return pipeline
+
+def source_of(dir_type: str) -> str:
+    """Source reported for a per-directory stage: 'sms' for SMS, 'ftp' for FTP_<type>"""
+    return "sms" if dir_type == "SMS" else "ftp"
+
+def summarize_run(node_stats: Dict[str, Dict]) -> Dict[str, bool]:
+    """Collapse node results into the per-source flags the job has always reported"""
+    return {
+        "socrata": node_stats.get("socrata", {}).get("status") == "updated",
+        "sms": node_stats.get("sms", {}).get("status") == "updated",
+        "ftp": any(node_stats.get(f"ftp_{t}", {}).get("status") == "updated" for t in FTP_FILE_TYPES)
+    }
+
+async def run_update_job(status_tracker=None) -> Dict[str, Dict]:
+    """Build and run the update graph once; returns per-node stats"""
+    timeout = aiohttp.ClientTimeout(total=None, connect=60, sock_read=3600)
+    zip_processor = ZipProcessor(DATA_DIR)
+    # FTP transfers use their own pooled connections, not the HTTP session
+    ftp_handler = FTPHandler(status_tracker)
+    try:
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            pipeline = build_update_pipeline(session, ftp_handler, zip_processor, status_tracker)
+            node_stats = await pipeline.run()
+    finally:
+        await asyncio.to_thread(ftp_handler.close)
+        await zip_processor.close()
+
+    for name, record in node_stats.items():
+        logger.info(
+            f"Stage {name}: {record['status']} in {record['duration']:.1f}s"
+            + (f", {record['bytes'] / (1024 * 1024):.1f}MB" if record.get("bytes") else "")
+        )
+    return node_stats
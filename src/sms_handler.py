@@ -1,20 +1,31 @@
 # src/sms_handler.py
 
 import os
+import json
 import logging
 import aiohttp, aiofiles
 import asyncio
+import time
 from datetime import datetime, timedelta
-from config.settings import SMS_BASE_URL, DATA_DIR
-from src.utils import ProgressBar
-from src.error_handler import APIError
+from config.settings import SMS_BASE_URL, DATA_DIR, SMS_NEGATIVE_CACHE_TTL, SMS_REMOTE_EXTRACT
+from src.utils import ProgressBar, download_resumable
+from src.error_handler import APIError, RangeNotSupportedError
+from src.remote_zip import RemoteZip
+from src.run_manifest import update_manifest
+
+# Marker left in the SMS directory for an archive whose member was extracted remotely
+REMOTE_MARKER_SUFFIX = '.remote.json'
+
+# SMS filenames confirmed missing on the server: filename -> monotonic expiry time
+_missing_files = {}
 
 class SMSHandler:
-    def __init__(self, session):
+    def __init__(self, session, status_tracker=None):
         self.base_url = SMS_BASE_URL
         self.base_dir = os.path.join(DATA_DIR, 'SMS')  # Will create if doesn't exist
         self.logger = logging.getLogger(self.__class__.__name__)
         self.session = session
+        self.status_tracker = status_tracker
 
     async def download_latest_sms_file(self):
         # Create SMS directory if it doesn't exist
@@ -27,7 +38,7 @@ class SMSHandler:
             return False
 
         # Check if we already have this file
-        local_files = [f for f in os.listdir(self.base_dir) if f.endswith('.zip')]
+        local_files = self.list_local_files()
         
         if local_files:
             latest_local_file = max(local_files, key=lambda x: self.extract_date_from_filename(x))
@@ -35,70 +46,161 @@ class SMSHandler:
                 self.logger.info("Already have the latest SMS file")
                 return False
 
-        # Remove old files before downloading new one
-        for old_file in local_files:
-            old_file_path = os.path.join(self.base_dir, old_file)
-            os.remove(old_file_path)
-            self.logger.info(f"Removed old file: {old_file}")
+        url = f"{self.base_url}{latest_file}"
+
+        # Pull just the text member out of the remote archive when the server allows it
+        if SMS_REMOTE_EXTRACT:
+            try:
+                changed = await self.extract_remote(url, latest_file)
+                if changed is not None:
+                    self.remove_old_files(local_files, latest_file)
+                    return changed
+            except RangeNotSupportedError as e:
+                self.logger.info(f"Remote extraction unavailable, downloading whole archive: {str(e)}")
+            except (APIError, aiohttp.ClientError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                # Transport errors mid-extraction: the whole-archive download retries and resumes
+                self.logger.warning(f"Remote extraction of {latest_file} failed, downloading whole archive: {str(e)}")
 
         # Download the latest file
-        url = f"{self.base_url}{latest_file}"
         local_path = os.path.join(self.base_dir, latest_file)
         self.logger.info(f"Downloading {latest_file} from {url}")
-        await self.download_file(url, local_path)
+        size, sha256 = await self.download_file(url, local_path)
         self.logger.info(f"Downloaded SMS file: {latest_file}")
-        return True
+        self.remove_old_files(local_files, latest_file)
+        return await asyncio.to_thread(
+            update_manifest, 'SMS', 'record_input', sha256, size,
+            base_dir=DATA_DIR, file=latest_file, source=url, mode='download'
+        )
+
+    def remove_old_files(self, local_files, latest_file):
+        """Remove superseded archives and remote markers once the latest one is in place"""
+        for old_file in local_files:
+            if old_file == latest_file:
+                continue
+            for old_path in (os.path.join(self.base_dir, old_file),
+                             os.path.join(self.base_dir, f"{old_file}{REMOTE_MARKER_SUFFIX}")):
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+            self.logger.info(f"Removed old file: {old_file}")
+
+    def list_local_files(self):
+        """Local SMS archives: downloaded zips plus archives extracted remotely"""
+        if not os.path.exists(self.base_dir):
+            return []
+        local_files = []
+        for f in os.listdir(self.base_dir):
+            if f.endswith('.zip'):
+                local_files.append(f)
+            elif f.endswith(f".zip{REMOTE_MARKER_SUFFIX}"):
+                local_files.append(f[:-len(REMOTE_MARKER_SUFFIX)])
+        return local_files
+
+    async def extract_remote(self, url, filename):
+        """Extract the archive's SMS text member into Extracted/ without downloading the zip.
+
+        Returns whether the content changed since the last run, or None when
+        the member is missing and the whole archive has to be downloaded.
+        """
+        date = filename.split('_')[-1].split('.')[0]
+        member = f"SMS_AB_PassProperty_{date}.txt"
+        extract_dir = os.path.join(self.base_dir, 'Extracted')
+        os.makedirs(extract_dir, exist_ok=True)
+
+        remote_zip = RemoteZip(self.session, url)
+        progress = ProgressBar(
+            f"Extracting {member} from {filename}",
+            status_tracker=self.status_tracker,
+            dataset_name="SMS",
+            source="sms"
+        )
+        entry = await remote_zip.extract_member(member, os.path.join(extract_dir, member), progress)
+        if not entry:
+            self.logger.error(f"Target file {member} not found in {filename}")
+            return None
+
+        # Older months' text files are superseded by this one
+        for old_file in os.listdir(extract_dir):
+            if old_file.startswith('SMS_AB_PassProperty_') and old_file.lower() != member.lower():
+                os.remove(os.path.join(extract_dir, old_file))
+
+        async with aiofiles.open(os.path.join(self.base_dir, f"{filename}{REMOTE_MARKER_SUFFIX}"), 'w') as f:
+            await f.write(json.dumps({
+                'url': url,
+                'member': entry['name'],
+                'crc': entry['crc'],
+                'file_size': entry['file_size'],
+                'compressed_size': entry['compressed_size'],
+                'extracted_at': datetime.utcnow().isoformat()
+            }, indent=2))
+        self.logger.info(f"Extracted SMS file {member} remotely from {filename}")
+        return await asyncio.to_thread(
+            update_manifest, 'SMS', 'record_input', entry['sha256'], entry['file_size'],
+            base_dir=DATA_DIR, file=filename, member=entry['name'], source=url, mode='remote'
+        )
 
     async def find_latest_available_file(self):
         current_date = datetime.utcnow()
-        available_files = []
 
-        # Check files from 2 months in the past to 2 months in the future
-        for i in range(-2, 3):  # -2, -1, 0, 1, 2
+        # Check files from 2 months in the past to 2 months in the future, newest first
+        candidates = []
+        for i in range(2, -3, -1):  # 2, 1, 0, -1, -2
             check_date = current_date + timedelta(days=30 * i)
             filename = f"SMS_AB_PassProperty_{check_date.strftime('%Y%b')}.zip"
-            url = f"{self.base_url}{filename}"
-            
-            # Add debug logging
-            self.logger.debug(f"Checking URL: {url}")
-            
-            # Only check if file exists, don't download
-            exists = await self.file_exists(url)
-            self.logger.debug(f"File {filename} exists: {exists}")
-            
-            if exists:
-                self.logger.info(f"Found available file: {filename}")
-                available_files.append(filename)
-
-        if not available_files:
-            # Log which dates were checked
-            self.logger.warning("No files found for the following dates:")
-            for i in range(-2, 3):
-                check_date = current_date + timedelta(days=30 * i)
-                self.logger.warning(f"  - {check_date.strftime('%Y%b')}")
-            return None
+            expires = _missing_files.get(filename)
+            if expires and expires > time.monotonic():
+                self.logger.debug(f"Skipping {filename}, known missing")
+                continue
+            candidates.append(filename)
 
-        # Return the filename with the latest date
-        return max(available_files, key=lambda x: self.extract_date_from_filename(x))
+        # Probe all candidates at once, then take the newest that exists
+        probes = [
+            asyncio.create_task(self.file_exists(f"{self.base_url}{filename}"))
+            for filename in candidates
+        ]
+        try:
+            for filename, probe in zip(candidates, probes):
+                exists = await probe
+                self.logger.debug(f"File {filename} exists: {exists}")
+                if exists:
+                    self.logger.info(f"Found available file: {filename}")
+                    return filename
+                if exists is False:
+                    _missing_files[filename] = time.monotonic() + SMS_NEGATIVE_CACHE_TTL
+        finally:
+            # Older months no longer matter once a newer one is found
+            for probe in probes:
+                probe.cancel()
+
+        # Log which dates were checked
+        self.logger.warning("No files found for the following dates:")
+        for i in range(-2, 3):
+            check_date = current_date + timedelta(days=30 * i)
+            self.logger.warning(f"  - {check_date.strftime('%Y%b')}")
+        return None
 
     async def file_exists(self, url):
+        """Probe url with a 4-byte Range request.
+
+        Returns True for a ZIP, False when the file is confirmed missing and
+        None when the probe itself failed (the result is then not cached).
+        """
         try:
-            # Use GET request instead of HEAD, but only read a small amount
-            async with self.session.get(url) as response:
-                self.logger.debug(f"GET request to {url} returned status: {response.status}")
-                if response.status == 200:
-                    # Read just a small chunk to verify it's a ZIP file
-                    chunk = await response.content.read(8192)  # Read first 8KB
+            async with self.session.get(url, headers={'Range': 'bytes=0-3'}) as response:
+                self.logger.debug(f"Range request to {url} returned status: {response.status}")
+                if response.status in (200, 206):
                     # ZIP files start with PK magic number (PK\x03\x04)
+                    chunk = await response.content.read(4)
                     if chunk.startswith(b'PK'):
                         self.logger.debug(f"File exists and appears to be a valid ZIP: {url}")
                         return True
                     self.logger.debug("Response doesn't appear to be a ZIP file")
                     return False
-                return False
+                if response.status in (404, 410):
+                    return False
+                return None
         except Exception as e:
             self.logger.debug(f"Error checking URL {url}: {str(e)}")
-            return False
+            return None
 
     def extract_date_from_filename(self, filename):
         try:
@@ -109,25 +211,23 @@ class SMSHandler:
             return None
 
     async def download_file(self, url, local_path):
-        progress = ProgressBar(f"Downloading {os.path.basename(local_path)}")
+        progress = ProgressBar(
+            f"Downloading {os.path.basename(local_path)}",
+            status_tracker=self.status_tracker,
+            dataset_name="SMS",
+            source="sms"
+        )
+
+        def check_response(response):
+            # Verify we're not getting an HTML error page
+            content_type = response.headers.get('Content-Type', '')
+            if 'text/html' in content_type:
+                raise APIError(f"Received HTML instead of ZIP file from {url}")
+
         try:
-            async with self.session.get(url) as response:
-                response.raise_for_status()
-                # Verify we're not getting an HTML error page
-                content_type = response.headers.get('Content-Type', '')
-                if 'text/html' in content_type:
-                    raise APIError(f"Received HTML instead of ZIP file from {url}")
-                
-                total_size = 0
-                progress.start()
-                async with aiofiles.open(local_path, 'wb') as f:
-                    async for chunk in response.content.iter_chunked(1024*1024):  # 1MB chunks
-                        await f.write(chunk)
-                        total_size += len(chunk)
-                        progress.update(total_size)
-            progress.finish()
+            return await download_resumable(self.session, url, local_path, progress,
+                                            check_response=check_response)
+        except APIError:
+            raise
         except Exception as e:
-            progress.finish()
-            if os.path.exists(local_path):
-                os.remove(local_path)
             raise APIError(f"Failed to download {url}: {str(e)}")
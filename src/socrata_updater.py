@@ -1,13 +1,45 @@
 # src/socrata_updater.py
+import csv
+import io
+import hashlib
 import json
 import os
 import logging
+import asyncio
+import time
 import aiohttp
 import aiofiles
-from datetime import datetime
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlparse
 from src.error_handler import APIError, FileError
-from config.settings import DATA_DIR, DATASET_URLS
-from src.utils import ProgressBar
+from config.settings import (
+    DATA_DIR,
+    DATASET_URLS,
+    DATASET_OPTIONS,
+    SODA_PAGE_SIZE,
+    SODA_INCREMENTAL_MAX_ROWS,
+    SODA_FULL_REFRESH_DAYS,
+    SODA_EXPORT_PAGE_SIZE,
+    SODA_EXPORT_WORKERS,
+    SOCRATA_VIEW_CACHE_TTL,
+    SOCRATA_CONCURRENT_REFRESH,
+    SOCRATA_MAX_CONCURRENT_DOWNLOADS,
+    SOCRATA_MAX_DOWNLOADS_PER_HOST
+)
+from src.utils import ProgressBar, download_resumable
+from src.storage import (
+    STORAGE_SUFFIXES,
+    dataset_storage,
+    find_stored_file,
+    open_stored,
+    open_writer,
+    compression_of,
+    store_file
+)
+from src.run_manifest import update_manifest, sha256_file
+
+# View metadata shared by all SocrataUpdater instances: url -> (fetched_at, view)
+_view_cache = {}
 
 class SocrataUpdater:
     def __init__(self, session, status_tracker=None):
@@ -17,76 +49,346 @@ class SocrataUpdater:
         self.session = session
         self.status_tracker = status_tracker
 
-    async def update_and_download_datasets(self):
+    async def update_and_download_datasets(self, concurrent=None):
+        if concurrent is None:
+            concurrent = SOCRATA_CONCURRENT_REFRESH
+
+        if not concurrent:
+            any_updates = False
+            for dataset_name, dataset_url in self.datasets.items():
+                if await self.update_dataset(dataset_name, dataset_url):
+                    any_updates = True
+            return any_updates
+
+        global_limit = asyncio.Semaphore(max(1, SOCRATA_MAX_CONCURRENT_DOWNLOADS))
+        host_limits = {}
+        for dataset_url in self.datasets.values():
+            host = urlparse(dataset_url).netloc
+            if host not in host_limits:
+                host_limits[host] = asyncio.Semaphore(max(1, SOCRATA_MAX_DOWNLOADS_PER_HOST))
+
+        async def run_limited(dataset_name, dataset_url):
+            async with host_limits[urlparse(dataset_url).netloc]:
+                async with global_limit:
+                    return await self.update_dataset(dataset_name, dataset_url)
+
+        results = await asyncio.gather(
+            *(run_limited(name, url) for name, url in self.datasets.items()),
+            return_exceptions=True
+        )
+
         any_updates = False
-        for dataset_name, dataset_url in self.datasets.items():
+        for dataset_name, result in zip(self.datasets, results):
+            if isinstance(result, Exception):
+                self.logger.error(f"Error updating {dataset_name}: {str(result)}")
+            elif result:
+                any_updates = True
+        return any_updates
+
+    async def update_dataset(self, dataset_name, dataset_url):
+        """Check a single dataset and download it if the server copy is newer"""
+        try:
+            dataset_dir = os.path.join(self.base_dir, dataset_name)
+            os.makedirs(dataset_dir, exist_ok=True)
+            metadata_file = os.path.join(dataset_dir, f"{dataset_name}_metadata.json")
+
+            view = await self.fetch_view_metadata(dataset_url, dataset_name)
+            rows_updated_at = self.parse_rows_updated_at(view, dataset_url)
+            self.logger.info(f"Server update date for {dataset_name}: {rows_updated_at}")
+
+            needs_update = True
+            saved_metadata = await self.read_metadata(metadata_file)
+            if saved_metadata and 'rowsUpdatedAt' in saved_metadata:
+                local_date = datetime.fromisoformat(saved_metadata['rowsUpdatedAt'])
+                needs_update = rows_updated_at > local_date
+
+            if not needs_update:
+                self.logger.info(f"No updates for dataset {dataset_name}.")
+                return False
+
+            file_path = os.path.join(dataset_dir, f"{dataset_name}.csv")
+            storage = dataset_storage(dataset_name)
+            new_metadata = dict(saved_metadata or {})
+            new_metadata.update({
+                'rowsUpdatedAt': rows_updated_at.isoformat(),
+                'schema': view_schema(view)
+            })
+
+            options = DATASET_OPTIONS.get(dataset_name, {})
+            if options.get('incremental'):
+                try:
+                    if await self.sync_incremental(dataset_name, dataset_url, view, saved_metadata, file_path):
+                        new_metadata['syncMode'] = 'incremental'
+                        new_metadata['storage'] = await self.store(file_path, storage)
+                        stored_path = find_stored_file(file_path)
+                        sha256 = await asyncio.to_thread(sha256_file, stored_path, open_stored)
+                        changed = await asyncio.to_thread(
+                            update_manifest, dataset_name, 'record_input', sha256,
+                            os.path.getsize(stored_path), source=dataset_url, mode='incremental'
+                        )
+                        await self.save_metadata(metadata_file, new_metadata)
+                        self.logger.info(f"Dataset {dataset_name} updated incrementally.")
+                        return changed
+                except Exception as e:
+                    self.logger.warning(f"Incremental sync failed for {dataset_name}, using full export: {str(e)}")
+
+            self.logger.info(f"New update found for {dataset_name}. Downloading dataset.")
+            download_url = f"{dataset_url}/rows.csv?accessType=DOWNLOAD&api_foundry=true"
             try:
-                dataset_dir = os.path.join(self.base_dir, dataset_name)
-                os.makedirs(dataset_dir, exist_ok=True)
-                metadata_file = os.path.join(dataset_dir, f"{dataset_name}_metadata.json")
-
-                rows_updated_at = await self.check_dataset_update(dataset_url)
-                self.logger.info(f"Server update date for {dataset_name}: {rows_updated_at}")
-
-                needs_update = True
-                saved_metadata = await self.read_metadata(metadata_file)
-                if saved_metadata and 'rowsUpdatedAt' in saved_metadata:
-                    local_date = datetime.fromisoformat(saved_metadata['rowsUpdatedAt'])
-                    needs_update = rows_updated_at > local_date
-
-                if needs_update:
-                    self.logger.info(f"New update found for {dataset_name}. Downloading dataset.")
-                    download_url = f"{dataset_url}/rows.csv?accessType=DOWNLOAD&api_foundry=true"
-                    file_path = os.path.join(dataset_dir, f"{dataset_name}.csv")
-                    try:
-                        await self.download_file(download_url, file_path, dataset_name)
-                        await self.save_metadata(metadata_file, {
-                            'rowsUpdatedAt': rows_updated_at.isoformat()
-                        })
-                        self.logger.info(f"Dataset {dataset_name} updated successfully.")
-                        any_updates = True
-                    except APIError as download_error:
-                        self.logger.error(f"Failed to download {dataset_name}: {str(download_error)}")
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                        continue
+                if options.get('paged'):
+                    size, sha256, rows = await self.download_paged(dataset_url, view, file_path, dataset_name)
                 else:
-                    self.logger.info(f"No updates for dataset {dataset_name}.")
-            except Exception as e:
-                self.logger.error(f"Error updating {dataset_name}: {str(e)}")
+                    size, sha256 = await self.download_file(download_url, file_path, dataset_name)
+                    rows = None
+                changed = await asyncio.to_thread(
+                    update_manifest, dataset_name, 'record_input', sha256, size, rows,
+                    source=dataset_url, mode='full'
+                )
+                new_metadata['syncMode'] = 'full'
+                new_metadata['lastFullSync'] = datetime.utcnow().isoformat()
+                stored_copy = file_path + STORAGE_SUFFIXES[storage]
+                if not changed and stored_copy != file_path and os.path.exists(stored_copy):
+                    # Re-published with identical bytes: keep the stored copy, nothing downstream to do
+                    os.remove(file_path)
+                else:
+                    new_metadata['storage'] = await self.store(file_path, storage)
+                await self.save_metadata(metadata_file, new_metadata)
+                if not changed:
+                    self.logger.info(f"Dataset {dataset_name} was re-published with identical content.")
+                    return False
+                self.logger.info(f"Dataset {dataset_name} updated successfully.")
+                return True
+            except APIError as download_error:
+                # The previous copy is untouched and the .part file is kept for resuming
+                self.logger.error(f"Failed to download {dataset_name}: {str(download_error)}")
+                return False
+        except Exception as e:
+            self.logger.error(f"Error updating {dataset_name}: {str(e)}")
+            return False
 
-        return any_updates
+    async def fetch_view_metadata(self, url, dataset_name=None):
+        """Fetch a view's metadata, revalidating with the stored ETag/Last-Modified.
+
+        A view fetched less than SOCRATA_VIEW_CACHE_TTL seconds ago is served
+        from memory. Otherwise the request is conditional on the validators
+        saved in <dataset>_view.json and a 304 reuses the body stored there.
+        """
+        cached = _view_cache.get(url)
+        if cached and time.monotonic() - cached[0] < SOCRATA_VIEW_CACHE_TTL:
+            return cached[1]
 
-    async def check_dataset_update(self, url):
-        async with self.session.get(url) as response:
-            response.raise_for_status()
-            data = await response.json()
-            last_updated = data.get('rowsUpdatedAt')
-            if last_updated:
-                return datetime.fromtimestamp(last_updated)
+        cache_file = None
+        stored = None
+        headers = {}
+        if dataset_name:
+            cache_file = os.path.join(self.base_dir, dataset_name, f"{dataset_name}_view.json")
+            try:
+                stored = await self.read_metadata(cache_file)
+            except FileError as e:
+                self.logger.warning(str(e))
+            if stored and stored.get('view'):
+                if stored.get('etag'):
+                    headers['If-None-Match'] = stored['etag']
+                if stored.get('last_modified'):
+                    headers['If-Modified-Since'] = stored['last_modified']
+
+        async with self.session.get(url, headers=headers) as response:
+            if response.status == 304 and stored and stored.get('view'):
+                view = stored['view']
             else:
-                raise APIError(f"No 'rowsUpdatedAt' field found for dataset at {url}")
+                response.raise_for_status()
+                view = await response.json()
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                if cache_file and (etag or last_modified):
+                    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+                    await self.save_metadata(cache_file, {
+                        'etag': etag,
+                        'last_modified': last_modified,
+                        'view': view
+                    })
+
+        _view_cache[url] = (time.monotonic(), view)
+        return view
+
+    def parse_rows_updated_at(self, view, url):
+        last_updated = view.get('rowsUpdatedAt')
+        if last_updated:
+            return datetime.fromtimestamp(last_updated)
+        else:
+            raise APIError(f"No 'rowsUpdatedAt' field found for dataset at {url}")
+
+    async def sync_incremental(self, dataset_name, dataset_url, view, saved_metadata, file_path):
+        """Merge rows changed since the last sync into the local CSV.
+
+        Returns False when a full export is required instead: no local copy,
+        a schema change, no row identifier column, a change set larger than
+        SODA_INCREMENTAL_MAX_ROWS or a last full export older than
+        SODA_FULL_REFRESH_DAYS. Rows deleted upstream are not seen by the
+        SODA API and stay in the local copy until that full export.
+        """
+        schema = view_schema(view)
+        if not saved_metadata or 'rowsUpdatedAt' not in saved_metadata or not find_stored_file(file_path):
+            self.logger.info(f"No local baseline for {dataset_name}, full export required")
+            return False
+        if saved_metadata.get('schema') != schema:
+            self.logger.info(f"Schema of {dataset_name} changed, full export required")
+            return False
+        last_full_sync = saved_metadata.get('lastFullSync')
+        if not last_full_sync or \
+                datetime.utcnow() - datetime.fromisoformat(last_full_sync) > timedelta(days=SODA_FULL_REFRESH_DAYS):
+            self.logger.info(f"Last full export of {dataset_name} is over {SODA_FULL_REFRESH_DAYS} days old, "
+                             f"full export required")
+            return False
+
+        row_id = view.get('rowIdentifierColumnId')
+        key_field = next((c.get('fieldName') for c in view.get('columns', []) if c.get('id') == row_id), None)
+        if not key_field:
+            self.logger.info(f"{dataset_name} has no row identifier column, full export required")
+            return False
+
+        with open_stored(file_path) as f:
+            local_header = next(csv.reader(f), [])
+        name_to_field = {name: field for field, name, _ in schema}
+        if not local_header or any(name not in name_to_field for name in local_header):
+            self.logger.info(f"Local header of {dataset_name} does not match the schema, full export required")
+            return False
+
+        since = datetime.utcfromtimestamp(
+            datetime.fromisoformat(saved_metadata['rowsUpdatedAt']).timestamp()
+        ).strftime('%Y-%m-%dT%H:%M:%S')
+        changed = await self.fetch_changed_rows(dataset_url, since)
+        if changed is None:
+            self.logger.info(f"Too many changed rows in {dataset_name}, full export required")
+            return False
+
+        soda_header, soda_rows = changed
+        self.logger.info(f"Fetched {len(soda_rows)} changed rows for {dataset_name} since {since}")
+        updated, inserted = await asyncio.to_thread(
+            merge_changed_rows, file_path, local_header, name_to_field, key_field, soda_header, soda_rows
+        )
+        self.logger.info(f"Merged {dataset_name}: {updated} rows updated, {inserted} rows added")
+        return True
+
+    async def fetch_changed_rows(self, dataset_url, since):
+        """Page through the SODA resource for rows with :updated_at >= since"""
+        resource_url = f"{soda_resource_url(dataset_url)}.csv"
+
+        header = None
+        rows = []
+        offset = 0
+        while True:
+            params = {
+                '$where': f":updated_at >= '{since}'",
+                '$order': ':id',
+                '$limit': str(SODA_PAGE_SIZE),
+                '$offset': str(offset)
+            }
+            async with self.session.get(resource_url, params=params) as response:
+                response.raise_for_status()
+                text = await response.text()
+
+            page = list(csv.reader(io.StringIO(text)))
+            if not page:
+                break
+            header = header or page[0]
+            page_rows = page[1:]
+            rows.extend(page_rows)
+            if len(rows) > SODA_INCREMENTAL_MAX_ROWS:
+                return None
+            if len(page_rows) < SODA_PAGE_SIZE:
+                break
+            offset += SODA_PAGE_SIZE
+
+        return header or [], rows
 
     async def download_file(self, url, local_path, dataset_name):
         progress = ProgressBar(
             f"Downloading {os.path.basename(local_path)}", 
             status_tracker=self.status_tracker,
-            dataset_name=dataset_name
+            dataset_name=dataset_name,
+            source='socrata'
+        )
+        try:
+            return await download_resumable(
+                self.session, url, local_path, progress,
+                compressed_transfer=DATASET_OPTIONS.get(dataset_name, {}).get('compressed_transfer', False)
+            )
+        except Exception as e:
+            raise APIError(f"Failed to download: {str(e)}")
+
+    async def download_paged(self, dataset_url, view, local_path, dataset_name):
+        """Full export as parallel SODA pages stitched into one CSV.
+
+        Pages are ordered by :id and written under the same display-name
+        header as rows.csv. Values keep SODA formatting (ISO timestamps, raw
+        numbers), which differs from the display formatting of rows.csv, so
+        the file is not a drop-in replacement for the single-stream export.
+        """
+        schema = view_schema(view)
+        fields = [field for field, _, _ in schema]
+        resource_url = soda_resource_url(dataset_url)
+        progress = ProgressBar(
+            f"Downloading {os.path.basename(local_path)} (paged)",
+            status_tracker=self.status_tracker,
+            dataset_name=dataset_name,
+            source='socrata'
         )
+        page_paths = []
         try:
-            async with self.session.get(url) as response:
+            async with self.session.get(
+                f"{resource_url}.json", params={'$select': 'count(*) AS row_count'}
+            ) as response:
                 response.raise_for_status()
-                total_size = 0
-                progress.start()
-                async with aiofiles.open(local_path, 'wb') as f:
-                    async for chunk in response.content.iter_chunked(1024*1024):  # 1MB chunks
-                        await f.write(chunk)
-                        total_size += len(chunk)
-                        progress.update(total_size)
-            progress.finish()
+                row_count = int((await response.json())[0]['row_count'])
+
+            page_count = max(1, -(-row_count // SODA_EXPORT_PAGE_SIZE))
+            page_paths = [f"{local_path}.page{i:05d}" for i in range(page_count)]
+            self.logger.info(f"Exporting {row_count} rows of {dataset_name} in {page_count} pages")
+
+            workers = asyncio.Semaphore(max(1, SODA_EXPORT_WORKERS))
+            downloaded = 0
+            progress.start()
+
+            async def fetch_page(index):
+                nonlocal downloaded
+                query = urlencode({
+                    '$select': ','.join(fields),
+                    '$order': ':id',
+                    '$limit': SODA_EXPORT_PAGE_SIZE,
+                    '$offset': index * SODA_EXPORT_PAGE_SIZE
+                })
+                async with workers:
+                    size, _ = await download_resumable(self.session, f"{resource_url}.csv?{query}", page_paths[index])
+                downloaded += size
+                progress.update(downloaded)
+
+            results = await asyncio.gather(*(fetch_page(i) for i in range(page_count)), return_exceptions=True)
+            errors = [r for r in results if isinstance(r, Exception)]
+            if errors:
+                raise errors[0]
+            header = [name for _, name, _ in schema]
+            size, sha256 = await asyncio.to_thread(stitch_csv_pages, page_paths, header, local_path)
+            return size, sha256, row_count
         except Exception as e:
+            raise APIError(f"Failed paged download: {str(e)}")
+        finally:
             progress.finish()
-            raise APIError(f"Failed to download: {str(e)}")
+            # Pages are not resumed across runs: rows can shift between offsets,
+            # so drop any partial download state along with the pages
+            for page_path in page_paths:
+                for path in (page_path, f"{page_path}.part", f"{page_path}.part.json"):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    async def store(self, file_path, storage):
+        """Put the freshly written CSV into its at-rest format; returns the metadata record"""
+        stored_path = await asyncio.to_thread(store_file, file_path, storage)
+        return {
+            'file': os.path.basename(stored_path),
+            'compression': storage,
+            'bytes': os.path.getsize(stored_path)
+        }
 
     async def read_metadata(self, metadata_file):
         try:
@@ -104,3 +406,82 @@ class SocrataUpdater:
                 await f.write(json.dumps(metadata, indent=2))
         except Exception as e:
             raise FileError(f"Failed to save metadata to {metadata_file}: {str(e)}")
+
+def soda_resource_url(dataset_url):
+    """SODA resource endpoint (without extension) for an /api/views/<id> URL"""
+    parsed = urlparse(dataset_url)
+    view_id = parsed.path.rstrip('/').split('/')[-1]
+    return f"{parsed.scheme}://{parsed.netloc}/resource/{view_id}"
+
+def view_schema(view):
+    """Column signature of a Socrata view: [fieldName, name, dataTypeName] per user column"""
+    return [
+        [c.get('fieldName'), c.get('name'), c.get('dataTypeName')]
+        for c in view.get('columns', [])
+        if not str(c.get('fieldName', '')).startswith(':')
+    ]
+
+def merge_changed_rows(file_path, local_header, name_to_field, key_field, soda_header, soda_rows):
+    """Upsert SODA rows into the local CSV keyed on key_field; returns (updated, inserted).
+
+    The merged file keeps the storage format of the existing copy. The
+    merged rows keep SODA value formatting, which differs from the rows.csv
+    formatting of the rest of the file (see DATASET_OPTIONS).
+    """
+    soda_index = {field: i for i, field in enumerate(soda_header)}
+    local_fields = [name_to_field[name] for name in local_header]
+    key_index = local_fields.index(key_field)
+
+    changes = {}
+    for soda_row in soda_rows:
+        row = [soda_row[soda_index[field]] if field in soda_index else '' for field in local_fields]
+        changes[row[key_index]] = row
+
+    updated = 0
+    stored_path = find_stored_file(file_path)
+    temp_path = f"{stored_path}.merge"
+    with open_stored(stored_path) as src, \
+            open_writer(temp_path, compression_of(stored_path), 'w') as dst:
+        reader = csv.reader(src)
+        writer = csv.writer(dst, lineterminator='\n')
+        writer.writerow(next(reader))
+        for row in reader:
+            key = row[key_index] if len(row) > key_index else None
+            if key in changes:
+                writer.writerow(changes.pop(key))
+                updated += 1
+            else:
+                writer.writerow(row)
+        inserted = len(changes)
+        writer.writerows(changes.values())
+
+    os.replace(temp_path, stored_path)
+    return updated, inserted
+
+def stitch_csv_pages(page_paths, header, local_path):
+    """Concatenate CSV pages in order under a single header, then swap into place.
+
+    Returns (size, sha256) of the stitched file, hashed as it is written.
+    """
+    part_path = f"{local_path}.part"
+    digest = hashlib.sha256()
+    header_line = io.StringIO()
+    csv.writer(header_line, lineterminator='\n').writerow(header)
+    with open(part_path, 'wb') as dst:
+        def write(data):
+            digest.update(data)
+            dst.write(data)
+
+        write(header_line.getvalue().encode('utf-8'))
+        for page_path in page_paths:
+            with open(page_path, 'rb') as src:
+                src.readline()  # per-page header
+                last = b''
+                for chunk in iter(lambda: src.read(16 * 1024 * 1024), b''):
+                    write(chunk)
+                    last = chunk
+                if last and not last.endswith(b'\n'):
+                    write(b'\n')
+        size = dst.tell()
+    os.replace(part_path, local_path)
+    return size, digest.hexdigest()
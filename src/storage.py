@@ -0,0 +1,123 @@
+# src/storage.py
+import io
+import os
+import gzip
+import shutil
+import logging
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, only needed for 'zstd' storage
+    zstandard = None
+
+from config.settings import DATASET_OPTIONS, DATASET_STORAGE, STORAGE_COMPRESSION_LEVEL
+
+logger = logging.getLogger(__name__)
+
+STORAGE_SUFFIXES = {
+    'zstd': '.zst',
+    'gzip': '.gz',
+    'plain': ''
+}
+
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+
+def dataset_storage(dataset_name):
+    """Configured at-rest format of a dataset: 'plain', 'gzip' or 'zstd'"""
+    compression = DATASET_OPTIONS.get(dataset_name, {}).get('storage', DATASET_STORAGE)
+    if compression not in STORAGE_SUFFIXES:
+        raise ValueError(f"Unknown storage format {compression!r} for {dataset_name}")
+    if compression == 'zstd' and zstandard is None:
+        logger.warning(f"zstandard is not installed, storing {dataset_name} as gzip")
+        return 'gzip'
+    return compression
+
+def compression_of(path):
+    for compression, suffix in STORAGE_SUFFIXES.items():
+        if suffix and path.endswith(suffix):
+            return compression
+    return 'plain'
+
+def logical_path(path):
+    """Path without its storage suffix, e.g. data/X/X.csv for data/X/X.csv.gz"""
+    suffix = STORAGE_SUFFIXES[compression_of(path)]
+    return path[:-len(suffix)] if suffix else path
+
+def stored_variants(path):
+    base = logical_path(path)
+    return [base + suffix for suffix in STORAGE_SUFFIXES.values() if os.path.exists(base + suffix)]
+
+def find_stored_file(path):
+    """The file actually holding path's data, in whatever format it is stored, or None"""
+    variants = stored_variants(path)
+    if not variants:
+        return None
+    return max(variants, key=os.path.getmtime)
+
+def open_stored(path, mode='rt', encoding='utf-8', newline='', errors='strict'):
+    """Open a dataset file for reading regardless of how it is stored.
+
+    path may be the plain name (X.csv) or any stored variant (X.csv.gz,
+    X.csv.zst). Use mode 'rb' for bytes; text mode decodes with encoding.
+    """
+    if compression_of(path) != 'plain' and os.path.exists(path):
+        actual = path
+    else:
+        actual = find_stored_file(path)
+    if actual is None:
+        raise FileNotFoundError(path)
+    compression = compression_of(actual)
+    if compression == 'gzip':
+        raw = gzip.open(actual, 'rb')
+    elif compression == 'zstd':
+        raw = zstandard.ZstdDecompressor().stream_reader(open(actual, 'rb'), closefd=True)
+    else:
+        raw = open(actual, 'rb')
+    if 'b' in mode:
+        return raw
+    return io.TextIOWrapper(io.BufferedReader(raw) if compression == 'zstd' else raw,
+                            encoding=encoding, newline=newline, errors=errors)
+
+def open_writer(path, compression, mode='wb', encoding='utf-8', newline=''):
+    """Open path for writing in the given format (path is used exactly as given)"""
+    if compression == 'gzip':
+        raw = gzip.open(path, 'wb', compresslevel=STORAGE_COMPRESSION_LEVEL.get('gzip', 6))
+    elif compression == 'zstd':
+        raw = zstandard.ZstdCompressor(level=STORAGE_COMPRESSION_LEVEL.get('zstd', 3)).stream_writer(
+            open(path, 'wb'), closefd=True
+        )
+    else:
+        raw = open(path, 'wb')
+    if 'b' in mode:
+        return raw
+    return io.TextIOWrapper(raw, encoding=encoding, newline=newline)
+
+def store_file(path, compression):
+    """Make path's data stored in the given format; returns the stored path.
+
+    The new file is written beside the old one and swapped in with
+    os.replace before the other variants are removed, so a reader always
+    finds a complete copy. A no-op when the data is already in that format.
+    """
+    current = find_stored_file(path)
+    if current is None:
+        raise FileNotFoundError(path)
+    target = logical_path(path) + STORAGE_SUFFIXES[compression]
+    if current != target:
+        temp_path = f"{target}.tmp"
+        try:
+            with open_stored(current, 'rb') as src, open_writer(temp_path, compression) as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+            os.replace(temp_path, target)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        logger.info(
+            f"Stored {os.path.basename(target)} ({os.path.getsize(current) / (1024 * 1024):.1f}MB -> "
+            f"{os.path.getsize(target) / (1024 * 1024):.1f}MB)"
+        )
+    for variant in stored_variants(path):
+        if variant != target:
+            os.remove(variant)
+    return target
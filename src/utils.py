@@ -1,5 +1,16 @@
 import sys
+import os
+import json
 import time
+import hashlib
+import asyncio
+import logging
+import aiohttp
+import aiofiles
+from config.settings import DOWNLOAD_MAX_RETRIES, DOWNLOAD_RETRY_DELAY
+from src.services.metrics import record_download
+
+logger = logging.getLogger(__name__)
 
 class ProgressBar:
     def __init__(self, description="Downloading", **kwargs):
@@ -7,33 +18,171 @@ class ProgressBar:
         self.start_time = None
         self.last_update = 0
         self.update_interval = 0.5
+        self.initial_size = 0
+        self.downloaded_size = 0
         # Store status tracker and dataset name if provided
         self.status_tracker = kwargs.get('status_tracker')
         self.dataset_name = kwargs.get('dataset_name')
+        # Labels for the download metrics recorded on finish
+        self.source = kwargs.get('source')
+        self.metric_dataset = kwargs.get('metric_dataset', self.dataset_name)
 
-    def start(self):
+    def start(self, initial_size=0):
         self.start_time = time.time()
         self.last_update = self.start_time
-        sys.stdout.write(f"\r{self.description}: 0.0MB [0.0MB/s]")
+        self.initial_size = initial_size
+        self.downloaded_size = initial_size
+        sys.stdout.write(f"\r{self.description}: {initial_size / (1024 * 1024):.1f}MB [0.0MB/s]")
         sys.stdout.flush()
 
     def update(self, downloaded_size):
+        self.downloaded_size = downloaded_size
         current_time = time.time()
         if current_time - self.last_update >= self.update_interval:
             mb_downloaded = downloaded_size / (1024 * 1024)
             elapsed_time = max(current_time - self.start_time, 0.1)
-            speed = mb_downloaded / elapsed_time
-            
+            speed = (downloaded_size - self.initial_size) / (1024 * 1024) / elapsed_time
+
             # Update status tracker if available
             if self.status_tracker and self.dataset_name:
                 self.status_tracker.update_progress(self.dataset_name, mb_downloaded, speed)
-            
+
             sys.stdout.write(f"\r{self.description}: {mb_downloaded:.1f}MB [{speed:.1f}MB/s]")
             sys.stdout.flush()
             self.last_update = current_time
 
     def finish(self):
+        if self.source and self.start_time is not None:
+            record_download(
+                self.source,
+                self.metric_dataset or self.description,
+                self.downloaded_size - self.initial_size,
+                time.time() - self.start_time
+            )
+            self.start_time = None
         if self.status_tracker and self.dataset_name:
             self.status_tracker.clear_progress(self.dataset_name)
         sys.stdout.write("\n")
         sys.stdout.flush()
+
+def hash_prefix(path, chunk_size=8 * 1024 * 1024):
+    """SHA-256 object fed with the bytes already in path, to continue hashing a resumed file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest
+
+def read_part_state(state_path):
+    try:
+        with open(state_path, 'r') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def write_part_state(state_path, state):
+    with open(state_path, 'w') as f:
+        json.dump(state, f)
+
+async def download_resumable(session, url, local_path, progress=None, check_response=None,
+                             chunk_size=1024*1024, max_retries=None, compressed_transfer=False):
+    """Download url to local_path through a resumable .part file.
+
+    The body is streamed into ``<local_path>.part`` with a ``.part.json``
+    sidecar holding the bytes written and the server's ETag/Last-Modified.
+    A retry (or a later run) continues with a Range request guarded by
+    If-Range, and the finished file is moved into place with os.replace,
+    so local_path is never left half-written. Returns (size, sha256) of
+    the file; the SHA-256 is computed while streaming.
+
+    Requests ask for identity encoding (overriding aiohttp's default
+    gzip, deflate), so Range offsets and validators address the bytes on
+    disk. With compressed_transfer a fresh request asks for gzip instead
+    and the body is decoded in the stream; servers give gzip responses
+    their own (often weak) validators, so a gzip body is not resumable and
+    an interrupted transfer restarts from zero.
+    """
+    if max_retries is None:
+        max_retries = DOWNLOAD_MAX_RETRIES
+    part_path = f"{local_path}.part"
+    state_path = f"{part_path}.json"
+    attempt = 0
+
+    while True:
+        state = read_part_state(state_path)
+        offset = 0
+        headers = {}
+        if state and state.get('url') == url and os.path.exists(part_path):
+            validator = state.get('etag') or state.get('last_modified')
+            offset = os.path.getsize(part_path)
+            if validator and offset > 0:
+                headers['Range'] = f"bytes={offset}-"
+                headers['If-Range'] = validator
+            else:
+                offset = 0
+        headers['Accept-Encoding'] = 'gzip' if compressed_transfer and not offset else 'identity'
+
+        try:
+            async with session.get(url, headers=headers) as response:
+                if offset and response.status == 416:
+                    # The saved part no longer matches the remote file
+                    os.remove(part_path)
+                    os.remove(state_path)
+                    continue
+                response.raise_for_status()
+                if check_response:
+                    check_response(response)
+
+                content_range = response.headers.get('Content-Range', '')
+                content_encoding = response.headers.get('Content-Encoding', 'identity')
+                if offset and not (response.status == 206 and content_range.startswith(f"bytes {offset}-")
+                                   and content_encoding == 'identity'):
+                    logger.info(f"Server did not resume {os.path.basename(local_path)}, restarting from zero")
+                    offset = 0
+
+                # Validators of an encoded body would not match an identity resume
+                resumable = content_encoding == 'identity'
+                state = {
+                    'url': url,
+                    'etag': response.headers.get('ETag') if resumable else None,
+                    'last_modified': response.headers.get('Last-Modified') if resumable else None,
+                    'bytes_written': offset
+                }
+                write_part_state(state_path, state)
+                if offset:
+                    logger.info(f"Resuming {os.path.basename(local_path)} at {offset} bytes")
+
+                digest = await asyncio.to_thread(hash_prefix, part_path) if offset else hashlib.sha256()
+                total_size = offset
+                if progress:
+                    progress.start(offset)
+                chunks_since_state = 0
+                async with aiofiles.open(part_path, 'ab' if offset else 'wb') as f:
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        await f.write(chunk)
+                        digest.update(chunk)
+                        total_size += len(chunk)
+                        if progress:
+                            progress.update(total_size)
+                        chunks_since_state += 1
+                        if chunks_since_state >= 16:
+                            await f.flush()
+                            state['bytes_written'] = total_size
+                            write_part_state(state_path, state)
+                            chunks_since_state = 0
+
+            os.replace(part_path, local_path)
+            os.remove(state_path)
+            return total_size, digest.hexdigest()
+        except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            logger.warning(
+                f"Download of {os.path.basename(local_path)} interrupted ({str(e)}), "
+                f"retry {attempt}/{max_retries} in {DOWNLOAD_RETRY_DELAY}s"
+            )
+            await asyncio.sleep(DOWNLOAD_RETRY_DELAY)
+        finally:
+            if progress:
+                progress.finish()
@@ -0,0 +1,401 @@
+# src/version_store.py
+import io
+import os
+import json
+import zlib
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, chunks fall back to zlib
+    zstandard = None
+
+from config.settings import (
+    DATA_DIR,
+    VERSION_STORE_DIR,
+    VERSION_CHUNK_SIZE,
+    VERSION_KEEP_LAST,
+    VERSION_KEEP_MONTHLY,
+    VERSION_EXCLUDE_SUFFIXES,
+    STORAGE_COMPRESSION_LEVEL
+)
+from src.error_handler import FileError
+from src.generations import GenerationStore, is_publishable
+from src.storage import compression_of, logical_path, open_stored, open_writer
+from src.services.metrics import version_chunk_bytes
+
+# Inside VERSION_STORE_DIR: chunks/<ab>/<sha256><suffix> shared by all datasets,
+# versions/<dataset>/<version id>.json listing each file's chunks
+CHUNKS_DIR = 'chunks'
+VERSIONS_DIR = 'versions'
+CHUNK_SUFFIXES = {'zstd': '.zst', 'zlib': '.z'}
+
+def iter_chunks(f, average: int = VERSION_CHUNK_SIZE) -> Iterator[bytes]:
+    """Split a byte stream into content-defined chunks.
+
+    A chunk ends after a line whose CRC-32 falls below a threshold
+    proportional to the line's length, so chunks average `average` bytes
+    and each boundary depends only on the line before it: rows inserted or
+    removed change the chunks around the edit and none after it. Chunks are
+    kept between a quarter of and four times the average.
+    """
+    minimum, maximum = average // 4, average * 4
+    scale = (1 << 32) / average
+    lines = []
+    size = 0
+    for line in iter(lambda: f.readline(maximum), b''):
+        lines.append(line)
+        size += len(line)
+        if size >= maximum or (size >= minimum and zlib.crc32(line) < len(line) * scale):
+            yield b''.join(lines)
+            lines, size = [], 0
+    if lines:
+        yield b''.join(lines)
+
+def open_logical(path):
+    """Binary reader over a file's uncompressed content"""
+    if compression_of(path) == 'plain':
+        return open(path, 'rb')
+    raw = open_stored(path, 'rb')
+    # zstd stream readers have no efficient readline
+    return raw if compression_of(path) == 'gzip' else io.BufferedReader(raw)
+
+class _SnapshotLock:
+    """Snapshots run side by side; garbage collection waits for them and holds off new ones"""
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._active = 0
+        self._collecting = False
+
+    def acquire_shared(self):
+        with self._condition:
+            self._condition.wait_for(lambda: not self._collecting)
+            self._active += 1
+
+    def release_shared(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def acquire_exclusive(self):
+        with self._condition:
+            self._condition.wait_for(lambda: not self._collecting and self._active == 0)
+            self._collecting = True
+
+    def release_exclusive(self):
+        with self._condition:
+            self._collecting = False
+            self._condition.notify_all()
+
+_snapshot_lock = _SnapshotLock()
+
+class VersionStore:
+    """Compressed, chunk-deduplicated history of dataset versions.
+
+    Each file of a version is split into content-defined chunks of its
+    uncompressed content (gzip/zstd at-rest files are read through), and
+    every chunk is stored once, compressed, under its SHA-256. A version is
+    a JSON list of chunk hashes per file, so a night that changes a few
+    rows of a multi-GB CSV adds only the chunks around those rows. Expired
+    versions are dropped by apply_retention() and their unreferenced chunks
+    by collect_garbage().
+    """
+    def __init__(self, root: str = VERSION_STORE_DIR, data_dir: str = DATA_DIR):
+        self.root = root
+        self.data_dir = data_dir
+        self.chunks_dir = os.path.join(root, CHUNKS_DIR)
+        self.versions_dir = os.path.join(root, VERSIONS_DIR)
+        self.codec = 'zstd' if zstandard is not None else 'zlib'
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    # Chunks
+
+    def chunk_path(self, digest: str, codec: str) -> str:
+        return os.path.join(self.chunks_dir, digest[:2], digest + CHUNK_SUFFIXES[codec])
+
+    def find_chunk(self, digest: str) -> Optional[str]:
+        for codec in CHUNK_SUFFIXES:
+            path = self.chunk_path(digest, codec)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def put_chunk(self, data: bytes) -> Tuple[str, int]:
+        """Store a chunk unless present; returns its hash and the compressed bytes written"""
+        digest = hashlib.sha256(data).hexdigest()
+        if self.find_chunk(digest):
+            return digest, 0
+        if self.codec == 'zstd':
+            compressed = zstandard.ZstdCompressor(level=STORAGE_COMPRESSION_LEVEL.get('zstd', 3)).compress(data)
+        else:
+            compressed = zlib.compress(data, STORAGE_COMPRESSION_LEVEL.get('gzip', 6))
+        path = self.chunk_path(digest, self.codec)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(temp_path, path)
+        return digest, len(compressed)
+
+    def get_chunk(self, digest: str) -> bytes:
+        path = self.find_chunk(digest)
+        if path is None:
+            raise FileError(f"Chunk {digest} is missing from the version store")
+        with open(path, 'rb') as f:
+            compressed = f.read()
+        if path.endswith(CHUNK_SUFFIXES['zstd']):
+            if zstandard is None:
+                raise FileError(f"Chunk {digest} is zstd-compressed but zstandard is not installed")
+            data = zstandard.ZstdDecompressor().decompress(compressed)
+        else:
+            data = zlib.decompress(compressed)
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise FileError(f"Chunk {digest} is corrupt")
+        return data
+
+    # Versions
+
+    def version_path(self, dataset_name: str, version: str) -> str:
+        return os.path.join(self.versions_dir, dataset_name, f"{version}.json")
+
+    def version_ids(self, dataset_name: str) -> List[str]:
+        directory = os.path.join(self.versions_dir, dataset_name)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-len('.json')] for name in os.listdir(directory) if name.endswith('.json'))
+
+    def load_version(self, dataset_name: str, version: str) -> Dict:
+        """Record of a version given by a caller, checked against the stored ids"""
+        if version not in self.version_ids(dataset_name):
+            raise KeyError(f"{dataset_name} has no version {version}")
+        return self.read_version(dataset_name, version)
+
+    def read_version(self, dataset_name: str, version: str) -> Dict:
+        """Record of a version id taken from version_ids()"""
+        with open(self.version_path(dataset_name, version), 'r') as f:
+            return json.load(f)
+
+    def list_datasets(self) -> List[str]:
+        if not os.path.isdir(self.versions_dir):
+            return []
+        return sorted(os.listdir(self.versions_dir))
+
+    def list_versions(self, dataset_name: str) -> List[Dict]:
+        """Summaries of a dataset's versions, newest first"""
+        summaries = []
+        for version in reversed(self.version_ids(dataset_name)):
+            record = self.read_version(dataset_name, version)
+            summaries.append({key: value for key, value in record.items() if key != 'files'})
+        return summaries
+
+    def snapshot(self, dataset_name: str) -> Optional[Dict]:
+        """Record the dataset's published state as a new version; returns its summary, or None if unchanged.
+
+        The current generation (and its id) is used when one exists,
+        otherwise the working directory.
+        """
+        dataset_dir = os.path.join(self.data_dir, dataset_name)
+        generations = GenerationStore(dataset_dir)
+        source_dir = generations.current_dir()
+        if source_dir and os.path.isdir(source_dir):
+            version = generations.current_id()
+        else:
+            source_dir = dataset_dir
+            version = datetime.utcnow().strftime('%Y%m%dT%H%M%S%fZ')
+        if not os.path.isdir(source_dir):
+            return None
+
+        files = self._source_files(source_dir)
+        stats = {rel: os.stat(os.path.join(source_dir, rel)) for rel in files}
+        if not files or self._is_unchanged(dataset_name, stats):
+            return None
+
+        _snapshot_lock.acquire_shared()
+        try:
+            entries = {}
+            totals = {'bytes': 0, 'new_bytes': 0, 'stored_bytes': 0, 'chunks': 0, 'new_chunks': 0}
+            for rel in files:
+                entries[rel] = self._store_file(dataset_name, os.path.join(source_dir, rel), stats[rel], totals)
+            record = dict(
+                totals,
+                dataset=dataset_name,
+                version=version,
+                created_at=datetime.utcnow().isoformat(),
+                files=entries
+            )
+            path = self.version_path(dataset_name, version)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.tmp", 'w') as f:
+                json.dump(record, f)
+            os.replace(f"{path}.tmp", path)
+        finally:
+            _snapshot_lock.release_shared()
+
+        self.logger.info(
+            f"Recorded {dataset_name} version {version}: {totals['bytes'] / (1024 * 1024):.1f}MB in "
+            f"{totals['chunks']} chunks, {totals['new_chunks']} new "
+            f"({totals['stored_bytes'] / (1024 * 1024):.1f}MB stored)"
+        )
+        return {key: value for key, value in record.items() if key != 'files'}
+
+    def _source_files(self, source_dir: str) -> List[str]:
+        files = []
+        for root, dirs, names in os.walk(source_dir):
+            dirs[:] = [d for d in dirs if is_publishable(d)]
+            for name in names:
+                if is_publishable(name) and not name.endswith(VERSION_EXCLUDE_SUFFIXES):
+                    files.append(os.path.relpath(os.path.join(root, name), source_dir))
+        return sorted(files)
+
+    def _is_unchanged(self, dataset_name: str, stats: Dict[str, os.stat_result]) -> bool:
+        """True if the latest version holds the same data files (JSON bookkeeping aside)"""
+        versions = self.version_ids(dataset_name)
+        if not versions:
+            return False
+        latest = self.read_version(dataset_name, versions[-1])['files']
+        data_files = {rel for rel in stats if not rel.endswith('.json')}
+        if data_files != {rel for rel in latest if not rel.endswith('.json')}:
+            return False
+        return all(
+            latest[rel].get('source_size') == stats[rel].st_size
+            and latest[rel].get('source_mtime_ns') == stats[rel].st_mtime_ns
+            for rel in data_files
+        )
+
+    def _store_file(self, dataset_name: str, path: str, stat: os.stat_result, totals: Dict) -> Dict:
+        digest = hashlib.sha256()
+        chunks = []
+        size = 0
+        with open_logical(path) as f:
+            for data in iter_chunks(f):
+                chunk_digest, written = self.put_chunk(data)
+                chunks.append(chunk_digest)
+                digest.update(data)
+                size += len(data)
+                totals['chunks'] += 1
+                if written:
+                    totals['new_chunks'] += 1
+                    totals['new_bytes'] += len(data)
+                    totals['stored_bytes'] += written
+                version_chunk_bytes.inc(len(data), dataset=dataset_name, kind='new' if written else 'deduplicated')
+        totals['bytes'] += size
+        return {
+            'size': size,
+            'sha256': digest.hexdigest(),
+            'stored_as': compression_of(path),
+            'source_size': stat.st_size,
+            'source_mtime_ns': stat.st_mtime_ns,
+            'chunks': chunks
+        }
+
+    def materialize(self, dataset_name: str, version: str, target_dir: str, as_stored: bool = False) -> str:
+        """Rebuild a version's files under target_dir; returns target_dir.
+
+        Files are written uncompressed under their logical names (X.csv for
+        a stored X.csv.gz) unless as_stored is set. Every file is checked
+        against its recorded SHA-256 before it is moved into place.
+        """
+        record = self.load_version(dataset_name, version)
+        for rel, entry in record['files'].items():
+            if as_stored:
+                path, compression = os.path.join(target_dir, rel), entry['stored_as']
+            else:
+                path, compression = os.path.join(target_dir, logical_path(rel)), 'plain'
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.tmp"
+            digest = hashlib.sha256()
+            try:
+                with open_writer(temp_path, compression) as f:
+                    for chunk_digest in entry['chunks']:
+                        data = self.get_chunk(chunk_digest)
+                        digest.update(data)
+                        f.write(data)
+                if digest.hexdigest() != entry['sha256']:
+                    raise FileError(f"{rel} of {dataset_name} version {version} does not match its checksum")
+                os.replace(temp_path, path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        self.logger.info(f"Materialized {dataset_name} version {version} into {target_dir}")
+        return target_dir
+
+    # Retention
+
+    def apply_retention(self, dataset_name: str, keep_last: int = VERSION_KEEP_LAST,
+                        keep_monthly: int = VERSION_KEEP_MONTHLY) -> List[str]:
+        """Drop versions outside the policy; returns the removed version ids.
+
+        The newest keep_last versions are kept, plus the last version of each
+        of the newest keep_monthly calendar months.
+        """
+        versions = self.version_ids(dataset_name)
+        keep = set(versions[-keep_last:]) if keep_last > 0 else set()
+        month_ends = {}
+        for version in versions:
+            # Version ids start with a sortable UTC date, YYYYMMDD...
+            month_ends[version[:6]] = version
+        for month in sorted(month_ends)[-keep_monthly:] if keep_monthly > 0 else []:
+            keep.add(month_ends[month])
+        if versions:
+            keep.add(versions[-1])
+
+        removed = [version for version in versions if version not in keep]
+        for version in removed:
+            os.remove(self.version_path(dataset_name, version))
+            self.logger.info(f"Removed {dataset_name} version {version}")
+        return removed
+
+    def collect_garbage(self) -> Dict:
+        """Delete chunks no remaining version refers to"""
+        _snapshot_lock.acquire_exclusive()
+        try:
+            referenced = set()
+            for dataset_name in self.list_datasets():
+                for version in self.version_ids(dataset_name):
+                    for entry in self.read_version(dataset_name, version)['files'].values():
+                        referenced.update(entry['chunks'])
+
+            removed = 0
+            freed = 0
+            if os.path.isdir(self.chunks_dir):
+                for prefix in os.listdir(self.chunks_dir):
+                    directory = os.path.join(self.chunks_dir, prefix)
+                    for name in os.listdir(directory):
+                        digest = name.split('.', 1)[0]
+                        if digest in referenced and not name.endswith('.tmp'):
+                            continue
+                        path = os.path.join(directory, name)
+                        freed += os.path.getsize(path)
+                        os.remove(path)
+                        removed += 1
+            if removed:
+                self.logger.info(f"Removed {removed} unreferenced chunks ({freed / (1024 * 1024):.1f}MB)")
+            return {'chunks_removed': removed, 'bytes_freed': freed}
+        finally:
+            _snapshot_lock.release_exclusive()
+
+    def usage(self) -> Dict:
+        """Bytes on disk for chunks against the logical size of every kept version"""
+        stored = 0
+        chunks = 0
+        for root, _, names in os.walk(self.chunks_dir):
+            for name in names:
+                stored += os.path.getsize(os.path.join(root, name))
+                chunks += 1
+        logical = sum(
+            summary['bytes'] for dataset_name in self.list_datasets() for summary in self.list_versions(dataset_name)
+        )
+        return {'chunks': chunks, 'stored_bytes': stored, 'logical_bytes': logical}
+
+def archive_dataset(dataset_name: str, store: Optional[VersionStore] = None) -> Optional[Dict]:
+    """Snapshot one dataset and apply the retention policy; returns the new version's summary"""
+    store = store or VersionStore()
+    summary = store.snapshot(dataset_name)
+    if summary and store.apply_retention(dataset_name):
+        store.collect_garbage()
+    return summary
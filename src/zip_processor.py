@@ -1,103 +1,258 @@
 import os
+import json
+import hashlib
 import logging
 import asyncio
 import aiofiles
 from zipfile import ZipFile
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
+import time
 import shutil
+import tempfile
 import traceback
+from config.settings import ZIP_INCREMENTAL, ZIP_PROCESS_WORKERS
+from src.services.metrics import zip_extraction_duration, zip_extraction_bytes
+from src.run_manifest import read_manifest, update_manifest
+
+# Per-directory record of processed archives, kept next to the extracted files
+MANIFEST_NAME = '.zip_manifest.json'
+
+# Copy buffer for streaming a member out of its archive
+EXTRACT_BUFFER_SIZE = 16 * 1024 * 1024
+
+def file_sha256(path, chunk_size=8 * 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def output_is_valid(entry):
+    """True if the output recorded in a manifest entry is still on disk unchanged"""
+    try:
+        stat = os.stat(entry['output_path'])
+    except (KeyError, OSError):
+        return False
+    return stat.st_size == entry.get('output_size') and stat.st_mtime == entry.get('output_mtime')
+
+def extract_zip(zip_path, target_file, extract_dir, previous=None, known_sha256=None):
+    """Extract target_file from zip_path into extract_dir in a worker process.
+
+    When the archive's SHA-256 matches the previous manifest entry and its
+    output is intact, nothing is extracted. known_sha256 (the hash taken
+    during download) saves re-reading the archive. Returns the new manifest
+    entry (with 'extracted' telling whether work was done) or None when the
+    target is not in the archive.
+    """
+    stat = os.stat(zip_path)
+    sha256 = known_sha256 or file_sha256(zip_path)
+    if previous and previous.get('sha256') == sha256 and output_is_valid(previous):
+        return dict(previous, zip_size=stat.st_size, zip_mtime=stat.st_mtime, extracted=False)
+
+    with ZipFile(zip_path, 'r') as zip_ref:
+        target_lower = target_file.lower()
+        for info in zip_ref.infolist():
+            if info.filename.lower() == target_lower:
+                final_path = os.path.join(extract_dir, target_file)
+                rows, output_sha256 = stream_member(zip_ref, info, final_path)
+
+                output_stat = os.stat(final_path)
+                return {
+                    'zip_size': stat.st_size,
+                    'zip_mtime': stat.st_mtime,
+                    'sha256': sha256,
+                    'member': info.filename,
+                    'output_path': final_path,
+                    'output_size': output_stat.st_size,
+                    'output_mtime': output_stat.st_mtime,
+                    'output_rows': rows,
+                    'output_sha256': output_sha256,
+                    'processed_at': datetime.utcnow().isoformat(),
+                    'extracted': True
+                }
+    return None
+
+def stream_member(zip_ref, info, final_path, buffer_size=EXTRACT_BUFFER_SIZE):
+    """Inflate one member into a temp file beside final_path, then swap it in.
+
+    The member is copied through a single reusable buffer in one pass and
+    published with os.replace, so readers see either the old file or the
+    complete new one, never a truncated file. Returns (lines, sha256).
+    """
+    extract_dir = os.path.dirname(final_path)
+    fd, temp_path = tempfile.mkstemp(dir=extract_dir, prefix=f".{os.path.basename(final_path)}.", suffix='.tmp')
+    try:
+        buffer = bytearray(buffer_size)
+        view = memoryview(buffer)
+        rows = 0
+        digest = hashlib.sha256()
+        with zip_ref.open(info) as src, os.fdopen(fd, 'wb') as dst:
+            while True:
+                n = src.readinto(buffer)
+                if not n:
+                    break
+                dst.write(view[:n])
+                digest.update(view[:n])
+                rows += buffer.count(b'\n', 0, n)
+        os.replace(temp_path, final_path)
+        return rows, digest.hexdigest()
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
 
 class ZipProcessor:
-    def __init__(self, base_dir):
+    def __init__(self, base_dir, incremental=None):
         self.base_dir = base_dir
+        self.incremental = ZIP_INCREMENTAL if incremental is None else incremental
         self.logger = logging.getLogger(self.__class__.__name__)
-        self.executor = ThreadPoolExecutor(max_workers=3)
+        self.max_workers = ZIP_PROCESS_WORKERS or os.cpu_count() or 1
+        # Inflating is CPU bound, so real extractions run in worker processes
+        self.executor = None
+        # Bytes and lines written by the last process_directory call, per directory
+        self.last_stats = {}
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.executor
 
-    async def process_all_zips(self):
-        """Process all ZIP files in their respective directories"""
+    async def process_directory(self, dir_type):
+        """Process the ZIP files of one source directory (e.g. FTP_Crash or SMS)"""
         any_processed = False
-        dir_types = ["FTP_Crash", "FTP_Inspection", "FTP_Violation", "SMS"]
         tasks = []
+        self.last_stats[dir_type] = {}
+        dir_path = os.path.join(self.base_dir, dir_type)
+        self.logger.debug(f"Checking directory: {dir_path}")
 
-        # First ensure base directories exist with proper permissions
-        for dir_type in dir_types:
-            dir_path = os.path.join(self.base_dir, dir_type)
-            self.logger.debug(f"Checking directory: {dir_path}")
-            
-            try:
-                # Create base directory if it doesn't exist
-                if not os.path.exists(dir_path):
-                    os.makedirs(dir_path)
-                    self.logger.debug(f"Created base directory: {dir_path}")
-            except Exception as e:
-                self.logger.error(f"Could not create base directory {dir_path}: {str(e)}")
-                continue
+        # First ensure base directory exists with proper permissions
+        try:
+            # Create base directory if it doesn't exist
+            if not os.path.exists(dir_path):
+                os.makedirs(dir_path)
+                self.logger.debug(f"Created base directory: {dir_path}")
+        except Exception as e:
+            self.logger.error(f"Could not create base directory {dir_path}: {str(e)}")
+            return False
 
-            # Create Extracted subdirectory
-            extract_dir = os.path.join(dir_path, 'Extracted')
-            self.logger.debug(f"Attempting to create/clear directory: {extract_dir}")
-            
-            try:
-                # First try to create the directory if it doesn't exist
-                if not os.path.exists(extract_dir):
-                    os.makedirs(extract_dir)
-                    self.logger.debug(f"Created extract directory: {extract_dir}")
-                else:
-                    # If it exists, try to clean it
-                    try:
-                        # Instead of removing the directory, just remove its contents
-                        for item in os.listdir(extract_dir):
-                            item_path = os.path.join(extract_dir, item)
-                            try:
-                                if os.path.isfile(item_path):
-                                    os.unlink(item_path)
-                                elif os.path.isdir(item_path):
-                                    shutil.rmtree(item_path)
-                            except Exception as e:
-                                self.logger.error(f"Could not remove {item_path}: {str(e)}")
-                    except Exception as e:
-                        self.logger.error(f"Could not clean directory {extract_dir}: {str(e)}")
-                        # Continue anyway as the directory exists
-            except Exception as e:
-                self.logger.error(f"Could not create/access directory {extract_dir}: {str(e)}")
-                continue
+        # Find ZIP files in directory
+        try:
+            zip_files = [f for f in os.listdir(dir_path) if f.endswith('.zip')]
+        except Exception as e:
+            self.logger.error(f"Error processing directory {dir_path}: {str(e)}")
+            return False
+        if not zip_files:
+            # Nothing to re-extract, so keep what is already in Extracted/
+            # (e.g. SMS text files extracted straight from the remote archive)
+            self.logger.debug(f"No ZIP files in {dir_path}")
+            return False
 
-            # Find ZIP files in directory
-            try:
-                zip_files = [f for f in os.listdir(dir_path) if f.endswith('.zip')]
-                if zip_files:
-                    self.logger.debug(f"Found ZIP files in {dir_path}: {zip_files}")
-                    for zip_file in zip_files:
-                        task = asyncio.create_task(self.process_zip(dir_type, zip_file, extract_dir))
-                        tasks.append(task)
-            except Exception as e:
-                self.logger.error(f"Error processing directory {dir_path}: {str(e)}")
-                continue
+        # Create Extracted subdirectory
+        extract_dir = os.path.join(dir_path, 'Extracted')
+        self.logger.debug(f"Attempting to create/clear directory: {extract_dir}")
 
-        # Process all tasks if any exist
-        if tasks:
-            try:
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-                for result in results:
-                    if isinstance(result, Exception):
-                        self.logger.error(f"Task failed with error: {str(result)}")
-                        self.logger.error(f"Stack trace: {traceback.format_exc()}")
-                    elif result:
-                        any_processed = True
-            except Exception as e:
-                self.logger.error(f"Error processing ZIP files: {str(e)}")
-                self.logger.error(f"Stack trace: {traceback.format_exc()}")
+        try:
+            # First try to create the directory if it doesn't exist
+            if not os.path.exists(extract_dir):
+                os.makedirs(extract_dir)
+                self.logger.debug(f"Created extract directory: {extract_dir}")
+            elif not self.incremental:
+                # If it exists, try to clean it
+                try:
+                    # Instead of removing the directory, just remove its contents
+                    for item in os.listdir(extract_dir):
+                        item_path = os.path.join(extract_dir, item)
+                        try:
+                            if os.path.isfile(item_path):
+                                os.unlink(item_path)
+                            elif os.path.isdir(item_path):
+                                shutil.rmtree(item_path)
+                        except Exception as e:
+                            self.logger.error(f"Could not remove {item_path}: {str(e)}")
+                except Exception as e:
+                    self.logger.error(f"Could not clean directory {extract_dir}: {str(e)}")
+                    # Continue anyway as the directory exists
+        except Exception as e:
+            self.logger.error(f"Could not create/access directory {extract_dir}: {str(e)}")
+            return False
+
+        manifest = self.load_manifest(extract_dir) if self.incremental else {}
+        new_manifest = {}
+        # Hash of the downloaded archive, so unchanged archives are not re-read
+        run_input = read_manifest(dir_type, self.base_dir).data['input'] or {}
 
+        self.logger.debug(f"Found ZIP files in {dir_path}: {zip_files}")
+        for zip_file in zip_files:
+            task = asyncio.create_task(
+                self.process_zip(dir_type, zip_file, extract_dir, manifest.get(zip_file), new_manifest,
+                                 run_input if run_input.get('file') == zip_file else None)
+            )
+            tasks.append(task)
+
+        failed = False
+        try:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    failed = True
+                    self.logger.error(f"Task failed with error: {str(result)}")
+                    self.logger.error(f"Stack trace: {traceback.format_exc()}")
+                elif result:
+                    any_processed = True
+        except Exception as e:
+            self.logger.error(f"Error processing ZIP files: {str(e)}")
+            self.logger.error(f"Stack trace: {traceback.format_exc()}")
+
+        self.remove_stale_outputs(extract_dir, new_manifest)
+        self.save_manifest(extract_dir, new_manifest)
+        fresh = [e for f, e in new_manifest.items() if manifest.get(f, {}).get('processed_at') != e.get('processed_at')]
+        self.last_stats[dir_type] = {
+            'bytes': sum(e.get('output_size', 0) for e in fresh),
+            'rows': sum(e.get('output_rows', 0) for e in fresh)
+        }
+        if not failed and len(new_manifest) == len(zip_files):
+            update_manifest(dir_type, 'record_output', 'extract', None, run_input.get('sha256'),
+                            base_dir=self.base_dir, files={
+                                zip_file: {
+                                    'sha256': entry.get('sha256'),
+                                    'output': os.path.basename(entry['output_path']),
+                                    'output_sha256': entry.get('output_sha256'),
+                                    'rows': entry.get('output_rows')
+                                } for zip_file, entry in new_manifest.items()
+                            })
         return any_processed
 
-    async def process_zip(self, dir_type, filename, extract_dir):
-        """Process a single ZIP file"""
+    async def close(self):
+        """Shut down the worker processes once no extraction is running"""
+        if self.executor is not None:
+            # Workers are idle by now; wait so they exit cleanly
+            executor, self.executor = self.executor, None
+            await asyncio.to_thread(executor.shutdown, True)
+
+    async def process_zip(self, dir_type, filename, extract_dir, previous=None, new_manifest=None, run_input=None):
+        """Process a single ZIP file, skipping it if its output is still current.
+
+        run_input is the run manifest's record of this archive from its
+        download; its SHA-256 is reused when the size still matches.
+        """
         try:
-            self.logger.info(f"Processing {filename}")
             zip_path = os.path.join(self.base_dir, dir_type, filename)
             self.logger.debug(f"Full ZIP path: {zip_path}")
 
+            # Unchanged archive (size and mtime) with intact output: nothing to do
+            stat = os.stat(zip_path)
+            if (self.incremental and previous
+                    and previous.get('zip_size') == stat.st_size
+                    and previous.get('zip_mtime') == stat.st_mtime
+                    and output_is_valid(previous)):
+                self.logger.info(f"Skipping {filename}, already extracted")
+                if new_manifest is not None:
+                    new_manifest[filename] = previous
+                return False
+
+            self.logger.info(f"Processing {filename}")
+
             # Extract date from filename
             if dir_type == "SMS":
                 date = filename.split('_')[-1].split('.')[0]
@@ -112,62 +267,77 @@ class ZipProcessor:
                 "SMS": f"SMS_AB_PassProperty_{date}.txt"
             }[dir_type]
 
-            def extract_file():
-                try:
-                    self.logger.debug(f"Opening ZIP file: {zip_path}")
-                    with ZipFile(zip_path, 'r') as zip_ref:
-                        file_list = zip_ref.namelist()
-                        self.logger.debug(f"Files in ZIP: {file_list}")
-                        target_lower = target_file.lower()
-                        for file in file_list:
-                            if file.lower() == target_lower:
-                                self.logger.debug(f"Extracting {file} to {extract_dir}")
-                                try:
-                                    zip_ref.extract(file, extract_dir)
-                                except PermissionError as pe:
-                                    self.logger.error(f"Permission error extracting {file}: {str(pe)}")
-                                    raise
-                                
-                                extracted_path = os.path.join(extract_dir, file)
-                                final_path = os.path.join(extract_dir, target_file)
-                                
-                                # Rename if needed
-                                if extracted_path != final_path:
-                                    self.logger.debug(f"Renaming {extracted_path} to {final_path}")
-                                    if os.path.exists(final_path):
-                                        try:
-                                            os.remove(final_path)
-                                        except PermissionError as pe:
-                                            self.logger.error(f"Permission error removing existing file {final_path}: {str(pe)}")
-                                            raise
-                                    try:
-                                        os.rename(extracted_path, final_path)
-                                    except PermissionError as pe:
-                                        self.logger.error(f"Permission error renaming file: {str(pe)}")
-                                        raise
-                                return True
-                    return False
-                except Exception as e:
-                    self.logger.error(f"Error in extract_file: {str(e)}")
-                    self.logger.error(f"Stack trace: {traceback.format_exc()}")
-                    raise
-
-            extracted = await asyncio.get_event_loop().run_in_executor(
-                self.executor, 
-                extract_file
+            start = time.perf_counter()
+            entry = await asyncio.get_running_loop().run_in_executor(
+                self.get_executor(),
+                extract_zip,
+                zip_path,
+                target_file,
+                extract_dir,
+                previous if self.incremental else None,
+                run_input['sha256'] if run_input and run_input.get('size') == stat.st_size else None
             )
 
+            if not entry:
+                self.logger.error(f"Target file {target_file} not found in {filename}")
+                return False
+
+            extracted = entry.pop('extracted')
+            if new_manifest is not None:
+                new_manifest[filename] = entry
             if extracted:
+                zip_extraction_duration.observe(time.perf_counter() - start, directory=dir_type)
+                zip_extraction_bytes.observe(entry['output_size'], directory=dir_type)
                 self.logger.info(f"Extracted {target_file} to {extract_dir}")
-                return True
             else:
-                self.logger.error(f"Target file {target_file} not found in {filename}")
-                return False
+                self.logger.info(f"Skipping {filename}, content unchanged")
+            return extracted
 
         except Exception as e:
             self.logger.error(f"Error processing {filename}: {str(e)}")
             self.logger.error(f"Stack trace: {traceback.format_exc()}")
+            # Keep the last good output of an archive that failed this time
+            if previous and new_manifest is not None:
+                new_manifest[filename] = previous
             return False
 
+    def load_manifest(self, extract_dir):
+        manifest_path = os.path.join(extract_dir, MANIFEST_NAME)
+        try:
+            if os.path.exists(manifest_path):
+                with open(manifest_path, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            self.logger.warning(f"Could not read manifest {manifest_path}: {str(e)}")
+        return {}
+
+    def save_manifest(self, extract_dir, manifest):
+        manifest_path = os.path.join(extract_dir, MANIFEST_NAME)
+        try:
+            with open(manifest_path, 'w') as f:
+                json.dump(manifest, f, indent=2)
+        except Exception as e:
+            self.logger.error(f"Could not save manifest {manifest_path}: {str(e)}")
+
+    def remove_stale_outputs(self, extract_dir, manifest):
+        """Remove extracted text files that no current archive produced.
+
+        Other files in Extracted/ (e.g. the columnar stage's Parquet copies
+        and manifest) belong to later stages and are left alone.
+        """
+        if not self.incremental:
+            return
+        current = {os.path.basename(entry['output_path']) for entry in manifest.values()}
+        for item in os.listdir(extract_dir):
+            item_path = os.path.join(extract_dir, item)
+            if not item.endswith('.txt') or item in current or not os.path.isfile(item_path):
+                continue
+            try:
+                os.unlink(item_path)
+                self.logger.info(f"Removed stale extracted file {item}")
+            except Exception as e:
+                self.logger.error(f"Could not remove {item_path}: {str(e)}")
+
     def __del__(self):
-        self.executor.shutdown(wait=False)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,118 @@
+import asyncio
+import io
+import struct
+import zipfile
+import zlib
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from src.error_handler import APIError, RangeNotSupportedError
+from src.remote_zip import RemoteZip
+
+def build_zip64(members):
+    """Archive whose central directory only resolves through the ZIP64 records.
+
+    Sizes and offsets in the central directory and the end of central
+    directory record are the 0xFFFFFFFF / 0xFFFF markers, with the real
+    values in ZIP64 extra fields and the ZIP64 end of central directory.
+    """
+    body = io.BytesIO()
+    central = io.BytesIO()
+    for name, data in members.items():
+        encoded = name.encode()
+        compressed = zlib.compress(data)[2:-4]  # raw deflate
+        crc = zlib.crc32(data)
+        offset = body.tell()
+        body.write(struct.pack('<4sHHHHHIIIHH', b'PK\x03\x04', 45, 0, 8, 0, 0x21,
+                               crc, len(compressed), len(data), len(encoded), 0))
+        body.write(encoded + compressed)
+        extra = struct.pack('<HHQQQ', 0x0001, 24, len(data), len(compressed), offset)
+        central.write(struct.pack('<4sHHHHHHIIIHHHHHII', b'PK\x01\x02', 45, 45, 0, 8, 0, 0x21,
+                                  crc, 0xFFFFFFFF, 0xFFFFFFFF, len(encoded), len(extra), 0, 0, 0, 0,
+                                  0xFFFFFFFF))
+        central.write(encoded + extra)
+    cd_offset = body.tell()
+    body.write(central.getvalue())
+    zip64_eocd_offset = body.tell()
+    body.write(struct.pack('<4sQHHIIQQQQ', b'PK\x06\x06', 44, 45, 45, 0, 0,
+                           len(members), len(members), len(central.getvalue()), cd_offset))
+    body.write(struct.pack('<4sIQI', b'PK\x06\x07', 0, zip64_eocd_offset, 1))
+    body.write(struct.pack('<4sHHHHIIH', b'PK\x05\x06', 0, 0, 0xFFFF, 0xFFFF,
+                           0xFFFFFFFF, 0xFFFFFFFF, 0))
+    return body.getvalue()
+
+def build_zip(members, comment=b'', compression=zipfile.ZIP_DEFLATED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+        archive.comment = comment
+    return buffer.getvalue()
+
+def extract(tmp_path, archive, member, app=None):
+    """Serve archive over HTTP and extract member from it with RemoteZip"""
+    (tmp_path / 'archive.zip').write_bytes(archive)
+    if app is None:
+        app = web.Application()
+        app.router.add_static('/', tmp_path)  # FileResponse answers Range with 206
+    output_path = tmp_path / 'out' / member
+    output_path.parent.mkdir(exist_ok=True)
+
+    async def run():
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            remote = RemoteZip(session, str(server.make_url('/archive.zip')))
+            return await remote.extract_member(member, str(output_path))
+
+    return asyncio.run(run()), output_path
+
+CSV = b''.join(f"{i},carrier {i},{i * 3}\n".encode() for i in range(5000))
+
+def test_zip64_central_directory(tmp_path):
+    archive = build_zip64({'Crash.txt': CSV, 'Other.txt': b'other'})
+    assert zipfile.ZipFile(io.BytesIO(archive)).read('Crash.txt') == CSV
+
+    entry, output_path = extract(tmp_path, archive, 'crash.TXT')
+
+    assert entry['name'] == 'Crash.txt'
+    assert entry['file_size'] == len(CSV)
+    assert output_path.read_bytes() == CSV
+
+def test_eocd_found_behind_archive_comment(tmp_path):
+    archive = build_zip({'Inspection.txt': CSV}, comment=b'x' * 60000)
+
+    entry, output_path = extract(tmp_path, archive, 'Inspection.txt')
+
+    assert entry['file_size'] == len(CSV)
+    assert output_path.read_bytes() == CSV
+
+def test_missing_member_returns_none(tmp_path):
+    entry, output_path = extract(tmp_path, build_zip({'a.txt': b'a'}), 'b.txt')
+
+    assert entry is None
+    assert not output_path.exists()
+
+def test_crc_mismatch_raises_and_leaves_no_output(tmp_path):
+    archive = bytearray(build_zip({'Violation.txt': CSV}, compression=zipfile.ZIP_STORED))
+    data_start = archive.index(CSV[:64])
+    archive[data_start + 100] ^= 0x01
+
+    with pytest.raises(APIError, match="Checksum mismatch"):
+        extract(tmp_path, bytes(archive), 'Violation.txt')
+
+    assert list((tmp_path / 'out').iterdir()) == []
+
+def test_server_ignoring_range(tmp_path):
+    archive = build_zip({'a.txt': b'a'})
+
+    async def full_body(request):
+        return web.Response(body=archive)
+
+    app = web.Application()
+    app.router.add_get('/archive.zip', full_body)
+
+    with pytest.raises(RangeNotSupportedError):
+        extract(tmp_path, archive, 'a.txt', app=app)
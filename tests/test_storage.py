@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from src.storage import compression_of, logical_path, open_stored, open_writer, store_file
+
+TEXT = "DOT_NUMBER,LEGAL_NAME\n" + "".join(f"{i},Carrier Ünïcode {i}\r\n" for i in range(2000))
+
+def formats():
+    yield 'plain'
+    yield 'gzip'
+    try:
+        import zstandard  # noqa: F401
+        yield 'zstd'
+    except ImportError:
+        yield pytest.param('zstd', marks=pytest.mark.skip(reason="zstandard is not installed"))
+
+@pytest.mark.parametrize("compression", list(formats()))
+def test_writer_round_trip(tmp_path, compression):
+    path = str(tmp_path / "data.csv") + {'plain': '', 'gzip': '.gz', 'zstd': '.zst'}[compression]
+
+    with open_writer(path, compression, 'wt') as f:
+        f.write(TEXT)
+
+    assert compression_of(path) == compression
+    with open_stored(path) as f:
+        assert f.read() == TEXT
+    # The plain name finds whichever variant is on disk
+    with open_stored(str(tmp_path / "data.csv"), 'rb') as f:
+        assert f.read() == TEXT.encode('utf-8')
+
+@pytest.mark.parametrize("compression", [c for c in formats() if c != 'plain'])
+def test_store_file_converts_and_removes_other_variants(tmp_path, compression):
+    plain = tmp_path / "data.csv"
+    plain.write_bytes(TEXT.encode('utf-8'))
+
+    stored = store_file(str(plain), compression)
+
+    assert logical_path(stored) == str(plain)
+    assert os.listdir(tmp_path) == [os.path.basename(stored)]
+    with open_stored(stored) as f:
+        assert f.read() == TEXT
+
+    restored = store_file(stored, 'plain')
+
+    assert restored == str(plain)
+    assert os.listdir(tmp_path) == ["data.csv"]
+    assert plain.read_bytes() == TEXT.encode('utf-8')
+
+def test_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        open_stored(str(tmp_path / "absent.csv"))
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from src.services.update_pipeline import Pipeline
+
+def record_calls(events, name, result=True, error=None, delay=0):
+    async def node():
+        events.append(("start", name))
+        await asyncio.sleep(delay)
+        events.append(("end", name))
+        if error:
+            raise error
+        return result
+    return node
+
+def test_nodes_start_after_their_dependencies_finish():
+    events = []
+    pipeline = Pipeline(max_concurrency=4)
+    pipeline.add("publish", record_calls(events, "publish"), depends_on=["extract", "columnar"])
+    pipeline.add("columnar", record_calls(events, "columnar"), depends_on=["extract"])
+    pipeline.add("extract", record_calls(events, "extract", delay=0.01), depends_on=["download"])
+    pipeline.add("download", record_calls(events, "download", delay=0.01))
+    pipeline.add("other", record_calls(events, "other", result=False))
+
+    stats = asyncio.run(pipeline.run())
+
+    for node in pipeline.nodes.values():
+        for dep in node.depends_on:
+            assert events.index(("end", dep)) < events.index(("start", node.name))
+    # Independent nodes do not wait for the chain
+    assert events.index(("start", "other")) < events.index(("end", "download"))
+    assert list(stats) == ["publish", "columnar", "extract", "download", "other"]
+    assert stats["download"]["status"] == "updated"
+    assert stats["other"]["status"] == "unchanged"
+
+def test_failed_node_is_recorded_and_dependents_still_run():
+    events = []
+    pipeline = Pipeline()
+    pipeline.add("ftp_Crash", record_calls(events, "ftp_Crash", error=ConnectionError("refused")), source="ftp")
+    pipeline.add("extract_FTP_Crash", record_calls(events, "extract_FTP_Crash"),
+                 depends_on=["ftp_Crash"], source="ftp")
+
+    stats = asyncio.run(pipeline.run())
+
+    assert stats["ftp_Crash"]["status"] == "failed"
+    assert stats["ftp_Crash"]["error"] == "refused"
+    assert stats["ftp_Crash"]["result"] is False
+    assert stats["extract_FTP_Crash"]["status"] == "updated"
+    assert {record["source"] for record in stats.values()} == {"ftp"}
+    assert events.index(("end", "ftp_Crash")) < events.index(("start", "extract_FTP_Crash"))
+
+def test_dict_results_report_rows_and_bytes():
+    async def node():
+        return {"updated": True, "rows": 10, "bytes": 2048}
+
+    pipeline = Pipeline()
+    pipeline.add("socrata", node)
+
+    record = asyncio.run(pipeline.run())["socrata"]
+
+    assert (record["status"], record["rows"], record["bytes"]) == ("updated", 10, 2048)
+
+def test_concurrency_limit():
+    running = []
+    peak = []
+
+    async def node():
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        return True
+
+    pipeline = Pipeline(max_concurrency=2)
+    for i in range(6):
+        pipeline.add(f"node{i}", node)
+
+    asyncio.run(pipeline.run())
+
+    assert max(peak) == 2
+
+@pytest.mark.parametrize("edges, message", [
+    ({"a": ["b"], "b": ["a"]}, "Cycle"),
+    ({"a": ["missing"]}, "unknown node"),
+])
+def test_invalid_graphs_are_rejected(edges, message):
+    pipeline = Pipeline()
+    for name, depends_on in edges.items():
+        pipeline.add(name, record_calls([], name), depends_on=depends_on)
+
+    with pytest.raises(ValueError, match=message):
+        asyncio.run(pipeline.run())
+
+def test_duplicate_node_names_are_rejected():
+    pipeline = Pipeline()
+    pipeline.add("sms", record_calls([], "sms"))
+
+    with pytest.raises(ValueError, match="Duplicate"):
+        pipeline.add("sms", record_calls([], "sms"))
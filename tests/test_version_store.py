@@ -0,0 +1,65 @@
+import io
+import random
+
+from src.version_store import iter_chunks
+
+AVERAGE = 4096
+
+def make_rows(count, seed=1):
+    rng = random.Random(seed)
+    return [
+        f"{i},USDOT{rng.randrange(10**6, 10**7)},carrier {rng.random():.6f},{rng.choice('ABCDEF')}\n".encode()
+        for i in range(count)
+    ]
+
+def chunk(rows):
+    return list(iter_chunks(io.BytesIO(b''.join(rows)), AVERAGE))
+
+def common_prefix(a, b):
+    count = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        count += 1
+    return count
+
+def test_chunks_rebuild_the_input_within_size_bounds():
+    rows = make_rows(20000)
+    chunks = chunk(rows)
+
+    assert b''.join(chunks) == b''.join(rows)
+    # Chunks end on a line boundary, so the cap can be overrun by one row
+    longest_row = max(len(row) for row in rows)
+    assert all(AVERAGE // 4 <= len(c) < AVERAGE * 4 + longest_row for c in chunks[:-1])
+    assert AVERAGE / 2 < len(b''.join(rows)) / len(chunks) < AVERAGE * 2
+
+def test_insert_only_changes_the_chunks_around_it():
+    rows = make_rows(20000)
+    edited = rows[:10000] + make_rows(3, seed=2) + rows[10000:]
+
+    before, after = chunk(rows), chunk(edited)
+
+    prefix = common_prefix(before, after)
+    suffix = common_prefix(before[::-1], after[::-1])
+    assert prefix + suffix >= len(before) - 2
+    assert prefix > len(before) // 3 and suffix > len(before) // 3
+
+def test_boundaries_do_not_depend_on_read_position():
+    rows = make_rows(5000)
+    data = b''.join(rows)
+
+    class Trickle(io.RawIOBase):
+        """Reader handing out at most 7 bytes per read call"""
+        def __init__(self):
+            self.pos = 0
+
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            n = min(7, len(buffer), len(data) - self.pos)
+            buffer[:n] = data[self.pos:self.pos + n]
+            self.pos += n
+            return n
+
+    assert list(iter_chunks(io.BufferedReader(Trickle(), 16), AVERAGE)) == chunk(rows)